@@ -0,0 +1,419 @@
+#!/usr/bin/env python
+"""
+Gadget micro-benchmarks
+
+Measures the cost of client side primitives without any remote end point,
+remote calls being answered by local stand-ins.
+
+Usage: bench.py [benchmark ...]
+
+Available benchmarks:
+transport -- framed transport throughput for 1 KB to 50 MB messages,
+             compared to the former send/receive loops
+registry  -- mapping resolution cost for deep Android class hierarchies,
+             compared to the former linear scan
+memory    -- wrappers per MB, compared to the former object layout
+lifecycle -- entry point releases against a local stand-in server, which
+             fails on any use of a released entry point
+stats     -- cost of recording calls, and recording enabled by hooks
+codec     -- message encoding and decoding for every available codec,
+             checking that the end point decodes the original message
+"""
+
+import gc
+import sys
+import json
+import time
+import resource
+import socket
+import struct
+import threading
+
+from gadget import codec
+from gadget.transport import Transport
+from gadget.mapping import Registry
+from gadget.proto import Protocol, Service, Application
+
+
+def legacy_send(sock, payload):
+    """
+    Former frame sending loop, kept for comparison
+    """
+    message = struct.pack('>I', len(payload)) + payload
+    while len(message) > 0:
+        message = message[sock.send(message):]
+
+
+def legacy_receive(sock):
+    """
+    Former frame receiving loop, kept for comparison
+    """
+    length = struct.unpack('>I', sock.recv(4))[0]
+    result = ''
+    while len(result) < length:
+        result += sock.recv(length - len(result))
+    return result
+
+
+def timed(function, count):
+    """
+    Run a function several times and return the mean duration
+    """
+    start = time.time()
+    for _ in range(count):
+        function()
+    return (time.time() - start) / count
+
+
+def bench_transport():
+    """
+    Echo frames of increasing sizes over a local socket pair
+    """
+    sizes = [1024, 64 * 1024, 1024 * 1024, 10 * 1024 * 1024, 50 * 1024 * 1024]
+    print "%10s %14s %14s" % ("size", "legacy MB/s", "transport MB/s")
+    for size in sizes:
+        payload = 'x' * size
+        count = max(1, min(1000, (20 * 1024 * 1024) // size))
+        results = []
+        for send, receive, wrap in (
+                (legacy_send, legacy_receive, lambda sock: sock),
+                (Transport.send, Transport.receive, Transport)):
+            client, server = socket.socketpair()
+            client, server = wrap(client), wrap(server)
+
+            def echo():
+                for _ in range(count):
+                    send(server, receive(server))
+            thread = threading.Thread(target=echo)
+            thread.start()
+
+            def roundtrip():
+                send(client, payload)
+                assert len(receive(client)) == size
+
+            duration = timed(roundtrip, count)
+            thread.join()
+            client.close()
+            server.close()
+            results.append(2 * size / duration / 1024 / 1024)
+        print "%10d %14.1f %14.1f" % (size, results[0], results[1])
+
+
+# remote types of a custom view, as listed by getTypes
+VIEW_TYPES = [
+    'com.example.widget.ScoreBoardView', 'com.example.widget.BoardView',
+    'android.widget.LinearLayout', 'android.view.ViewGroup',
+    'android.view.View', 'java.lang.Object',
+    'android.view.View$OnClickListener', 'android.view.View$OnTouchListener',
+    'android.view.ViewParent', 'android.view.ViewManager',
+    'android.graphics.drawable.Drawable$Callback',
+    'android.view.KeyEvent$Callback',
+    'android.view.accessibility.AccessibilityEventSource',
+]
+
+
+def legacy_resolve(classnames):
+    """
+    Former mapping resolution, kept for comparison
+    """
+    for classname in classnames:
+        if classname in Registry.mappings:
+            return Registry.mappings[classname]
+
+
+def bench_registry():
+    """
+    Resolve the mapping of various hierarchies again and again
+    """
+    import gadget.types
+    hierarchies = [
+        ('view', VIEW_TYPES),
+        ('list', ['java.util.ArrayList', 'java.util.AbstractList',
+                  'java.util.AbstractCollection', 'java.lang.Object',
+                  'java.util.List', 'java.util.Collection',
+                  'java.lang.Iterable', 'java.util.RandomAccess',
+                  'java.lang.Cloneable', 'java.io.Serializable']),
+        ('integer', ['java.lang.Integer', 'java.lang.Number',
+                     'java.lang.Object', 'java.lang.Comparable',
+                     'java.io.Serializable']),
+    ]
+    count = 100000
+    print "%10s %14s %14s %10s" % ("types", "legacy us", "registry us",
+                                   "mapping")
+    for name, types in hierarchies:
+        legacy = timed(lambda: legacy_resolve(types), count)
+        Registry.resolved.clear()
+        types = tuple(types)
+        memoized = timed(lambda: Registry.resolve(types), count)
+        print "%10s %14.3f %14.3f %10s" % (
+            name, legacy * 1e6, memoized * 1e6,
+            Registry.resolve(types).__name__)
+
+
+class LegacyObject(object):
+    """
+    Former object layout, kept for comparison
+    """
+
+    def __init__(self, service, types, entry_point, path=[]):
+        self._service = service
+        self._entry_point = entry_point
+        self._types = types
+        self._path = path
+        self._field_cache = None
+        self._field_objects = {}
+        self._method_cache = None
+        self._methods = type('', (object,), {'__getattr__': self._getmethod})()
+        self._M = self._methods
+        self._properties = type('', (object,), {'__getattr__': self._getfield})()
+        self._P = self._properties
+        self._value = int(service.get_value(entry_point, path))
+
+    def _getmethod(self, name):
+        pass
+
+    def _getfield(self, name):
+        pass
+
+
+class StubService(object):
+    """
+    Service answering value requests locally
+    """
+
+    def get_value(self, entry_point, path):
+        return '42'
+
+
+def resident_memory():
+    """
+    Get the resident memory of the current process, in bytes
+    """
+    with open('/proc/self/statm') as statm:
+        pages = int(statm.read().split()[1])
+    return pages * resource.getpagesize()
+
+
+def bench_memory():
+    """
+    Allocate many Integer wrappers with both object layouts
+    """
+    from gadget.types import Integer
+    service = StubService()
+    count = 50000
+    kept = []
+    print "%10s %14s" % ("layout", "wrappers/MB")
+    for name, clazz, types in (
+            ('slots', Integer, ('java.lang.Integer', 'java.lang.Number',
+                                'java.lang.Object')),
+            ('legacy', LegacyObject, ['java.lang.Integer',
+                                      'java.lang.Number',
+                                      'java.lang.Object'])):
+        gc.collect()
+        before = resident_memory()
+        kept.append([clazz(service, types, 0, [index])
+                     for index in range(count)])
+        size = resident_memory() - before
+        print "%10s %14.0f" % (name, count / (size / 1024.0 / 1024.0))
+
+
+class StandInServer(object):
+    """
+    Local end point keeping an entry point stack of plain values
+
+    Entry points allocated by the client are pushed on the stack and
+    replaced by None once released. Any use of a released entry point
+    fails, as it would on a device.
+    """
+
+    def __init__(self, values):
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.bind(('127.0.0.1', 0))
+        self.listener.listen(1)
+        self.address = self.listener.getsockname()
+        # entry point 0 is the list of values
+        self.entry_points = [values]
+        self.releases = 0
+        self.released = set()
+        self.thread = threading.Thread(target=self.serve)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def resolve(self, entry_point, path=()):
+        if entry_point in self.released:
+            raise ValueError("released entry point %d" % entry_point)
+        value = self.entry_points[entry_point]
+        for index in path:
+            value = value[index]
+        return value
+
+    def push(self, value):
+        self.entry_points.append(value)
+        return len(self.entry_points) - 1
+
+    def answer(self, name, arguments):
+        if name == 'connectApp':
+            return None
+        elif name == 'getEntryPoints':
+            return ['0']
+        elif name == 'getTypes':
+            value = self.resolve(*arguments)
+            if value is None:
+                return []
+            elif value is self.entry_points[0]:
+                return ['android.content.Context', 'java.lang.Object']
+            return ['java.lang.Object']
+        elif name == 'getClass':
+            # no class is ever found
+            return self.push(None)
+        elif name == 'push':
+            return self.push(self.resolve(*arguments))
+        elif name == 'pushInt':
+            return self.push(arguments[0])
+        elif name == 'invokeMethodByName':
+            entry_point, path, _, parameters = arguments
+            values = [self.resolve(parameter) for parameter in parameters]
+            return self.push((self.resolve(entry_point, path), values))
+        elif name == 'releaseEntryPoints':
+            self.releases += 1
+            for entry_point in arguments[0]:
+                self.resolve(entry_point)
+                self.released.add(entry_point)
+            return None
+        raise ValueError("unknown method %s" % name)
+
+    def serve(self):
+        connection, _ = self.listener.accept()
+        transport = Transport(connection)
+        while True:
+            try:
+                request = json.loads(transport.receive())
+            except IOError:
+                return
+            try:
+                response = {'success': True, 'response': self.answer(
+                    request[1], request[2:])}
+            except (ValueError, LookupError) as error:
+                response = {'success': False, 'response': str(error)}
+            transport.send(json.dumps(response))
+
+
+def bench_lifecycle():
+    """
+    Pass wrappers and Python values as call arguments, then check that
+    entry points referenced by live wrappers were never released
+    """
+    count = 256
+    server = StandInServer(range(count))
+    service = Service(Protocol(server.address, 'standin'))
+    service.lifecycle.threshold = 16
+    wrappers = [service.get_field(0, [index]) for index in range(count)]
+    start = time.time()
+    for index, wrapper in enumerate(wrappers):
+        # the wrapper is pushed and rebound to the pushed entry point
+        service.virtual(0, [], 'add', service.to_arguments([wrapper]))
+        service.virtual(0, [], 'add', service.to_arguments([index]))
+    duration = time.time() - start
+    # fails if any entry point of a live wrapper was released
+    for wrapper in wrappers:
+        service.protocol.getTypes(wrapper._entry_point, [])
+    assert server.releases > 0
+    assert not server.released & set(
+        wrapper._entry_point for wrapper in wrappers)
+    live = service.lifecycle.stats()['live']
+    del wrappers, wrapper
+    gc.collect()
+    service.release_entry_points()
+    stats = service.lifecycle.stats()
+    assert stats['live'] == 0 and stats['pending'] == 0
+    print "%10s %10s %10s %10s %12s" % (
+        "calls", "releases", "live", "released", "us per call")
+    print "%10d %10d %10d %10d %12.1f" % (
+        2 * count, server.releases, live, stats['released'],
+        duration / (2 * count) * 1e6)
+    # disconnect, so that the server stops
+    del service
+    gc.collect()
+    server.thread.join()
+
+
+def server_decode(name, payload):
+    """
+    Decode a payload the way the end point does, strings being text
+    """
+    if name == 'msgpack':
+        return codec.msgpack.unpackb(payload, raw=False)
+    return json.loads(payload)
+
+
+def binary(value):
+    """
+    Check whether a decoded message holds bytes instead of text
+    """
+    if isinstance(value, dict):
+        value = value.items()
+    if isinstance(value, (list, tuple)):
+        return any(binary(item) for item in value)
+    return isinstance(value, bytes)
+
+
+def bench_codec():
+    """
+    Encode and decode a typical call, then check that the end point would
+    decode the very same message
+    """
+    message = ['com.example', 'invokeMethodByName', 12, [3, 0, 1], 'getName',
+               [{'type': 'java.lang.String', 'value': 'caf\xc3\xa9'}, 7]]
+    expected = json.loads(json.dumps(message))
+    count = 10000
+    print "%10s %12s %12s %10s" % ("codec", "us encode", "us decode", "bytes")
+    for name in codec.available():
+        instance = codec.get_codec(name)
+        payload = instance.encode(message)
+        decoded = server_decode(name, payload)
+        # unicode strings, not bytes, for method names and values
+        assert decoded == expected and not binary(decoded)
+        assert instance.decode(payload) == expected
+        print "%10s %12.2f %12.2f %10d" % (
+            name, timed(lambda: instance.encode(message), count) * 1e6,
+            timed(lambda: instance.decode(payload), count) * 1e6,
+            len(payload))
+
+
+def bench_stats():
+    """
+    Time calls without and with recording, recording being enabled by a
+    hook, then check that every call reached the hook
+    """
+    count = 2000
+    server = StandInServer([])
+    app = Application(server.address, 'standin')
+    call = lambda protocol=app.protocol: protocol.getTypes(0, [])
+    off = timed(call, count)
+    assert app.stats()['total']['calls'] == 0
+    calls = []
+    app.add_stats_hook(lambda *arguments: calls.append(arguments))
+    on = timed(call, count)
+    assert len(calls) == app.stats()['total']['calls'] == count
+    print "%14s %14s" % ("us unrecorded", "us recorded")
+    print "%14.1f %14.1f" % (off * 1e6, on * 1e6)
+    # disconnect, so that the server stops
+    del app, call
+    gc.collect()
+    server.thread.join()
+
+
+BENCHMARKS = {
+    'codec': bench_codec,
+    'lifecycle': bench_lifecycle,
+    'memory': bench_memory,
+    'registry': bench_registry,
+    'stats': bench_stats,
+    'transport': bench_transport,
+}
+
+
+if __name__ == '__main__':
+    for name in sys.argv[1:] or sorted(BENCHMARKS):
+        print "== %s" % name
+        BENCHMARKS[name]()
@@ -0,0 +1,532 @@
+"""
+Asynchronous Gadget client
+
+Asyncio based variant of the protocol, service and application classes,
+so that several remote applications or inspections may be driven
+concurrently from a single event loop. Messages use the very same framing
+as the blocking protocol. Answers are matched to requests in FIFO order,
+so any count of calls may be in flight over a single connection.
+
+The gadget package targets Python 2, hence the trollius port of asyncio is
+required and coroutines follow the trollius conventions:
+
+    @asyncio.coroutine
+    def main(loop):
+        app = yield From(AsyncApplication.connect(remote, package, loop))
+        score = yield From(app.context.mScore)
+        value = yield From(score.value)
+        add = yield From(score.add)
+        result = yield From(add(3))
+
+Remote objects are wrapped into AsyncObject instances whatever their type
+mapping is, since mapped classes perform blocking calls. Fields holding
+strings, integers or booleans are directly resolved to Python values.
+"""
+
+from collections import deque
+
+import trollius as asyncio
+from trollius import From, Return
+
+from mapping import MultipleDefinitionsError, instanceof
+from proto import Protocol, Service
+from transport import HEADER
+from codec import get_codec
+
+
+# remote types that are resolved to Python values
+VALUE_TYPES = {
+    'java.lang.Integer': int,
+    'java.lang.Boolean': lambda value: value == 'true',
+    'java.lang.String': lambda value: value,
+}
+
+
+class AsyncProtocol(object):
+    """
+    Asynchronous protocol implementation
+
+    Every remote call immediately writes its request and returns an asyncio
+    future, resolved by the dispatching task when the answer is received.
+    """
+
+    def __init__(self, reader, writer, app, loop=None, codec=None):
+        """
+        Initialize the protocol over an open connection
+
+        Keyword arguments:
+        reader -- asyncio stream reader of the connection
+        writer -- asyncio stream writer of the connection
+        app    -- inspected application package
+        loop   -- the event loop (default: the current event loop)
+        codec  -- message codec name or instance (see gadget.codec)
+        """
+        self._reader = reader
+        self._writer = writer
+        self._app = app
+        self._codec = get_codec(codec)
+        self._loop = asyncio.get_event_loop() if loop is None else loop
+        self._pending = deque()
+        self._task = asyncio.ensure_future(self._dispatch(), loop=self._loop)
+
+    @classmethod
+    @asyncio.coroutine
+    def connect(cls, remote, app, loop=None, codec=None):
+        """
+        Connect to the remote end point
+
+        Keyword arguments:
+        remote -- address and port of the remote end point
+        app    -- inspected application package
+        loop   -- the event loop
+        codec  -- message codec name or instance
+
+        Returns:
+        a connected protocol instance
+        """
+        reader, writer = yield From(
+            asyncio.open_connection(remote[0], remote[1], loop=loop))
+        protocol = cls(reader, writer, app, loop, codec)
+        yield From(protocol.connectApp())
+        raise Return(protocol)
+
+    def close(self):
+        """
+        Disconnect the protocol instance
+        """
+        self._task.cancel()
+        self._writer.close()
+
+    def call(self, name, arguments):
+        """
+        Send a request to the remote end point
+
+        Keyword arguments:
+        name      -- name of the remote method
+        arguments -- list of arguments for the method
+
+        Returns:
+        a future holding the remote result
+        """
+        future = asyncio.Future(loop=self._loop)
+        payload = Protocol._encode(self._app, name, arguments, self._codec)
+        self._writer.writelines([HEADER.pack(len(payload)), payload])
+        self._pending.append(future)
+        return future
+
+    @asyncio.coroutine
+    def _dispatch(self):
+        """
+        Receive answers and resolve the matching futures
+        """
+        try:
+            while True:
+                length = yield From(self._reader.readexactly(HEADER.size))
+                length, = HEADER.unpack(length)
+                payload = yield From(self._reader.readexactly(length))
+                future = self._pending.popleft()
+                if future.cancelled():
+                    continue
+                try:
+                    future.set_result(Protocol._decode(payload, self._codec))
+                except RuntimeError as error:
+                    future.set_exception(error)
+        except (asyncio.IncompleteReadError, IOError):
+            # the connection is lost, no answer will ever come
+            while len(self._pending) > 0:
+                future = self._pending.popleft()
+                if not future.cancelled():
+                    future.set_exception(IOError("Connection closed"))
+
+    def __getattr__(self, name):
+        """
+        Proxify every call to the remote end point using the call method
+        """
+        def proxy(*arguments):
+            """
+            Proxy function
+            """
+            return self.call(name, arguments)
+        # return the proxy
+        return proxy
+
+
+class AsyncService(object):
+    """
+    Asynchronous wrapping service over the protocol
+
+    Provides the same semantic wrappers as the blocking service, as
+    coroutines.
+    """
+
+    def __init__(self, protocol):
+        """
+        Initialize the service
+
+        Keyword arguments:
+        protocol -- an asynchronous protocol instance
+        """
+        self.protocol = protocol
+
+    def _wrap(self, types, entry_point, path, unwrap=True):
+        """
+        Wrap a remote object, or fetch its value for basic types
+
+        Keyword arguments:
+        types       -- list of remote types of the object
+        entry_point -- the object entry point
+        path        -- path from the entry point to the object
+        unwrap      -- whether basic types are resolved to Python values
+        """
+        if len(types) == 0:
+            return None
+        if unwrap and types[0] in VALUE_TYPES:
+            return self.get_value(entry_point, path, VALUE_TYPES[types[0]])
+        return AsyncObject(self, types, entry_point, path)
+
+    @asyncio.coroutine
+    def get_entry_points(self):
+        """
+        List entry points as objects
+
+        Types of every entry point are requested concurrently.
+        """
+        count = len((yield From(self.protocol.getEntryPoints())))
+        types = yield From(asyncio.gather(
+            *[self.protocol.getTypes(index, []) for index in range(count)]))
+        raise Return([self._wrap(types[index], index, [], unwrap=False)
+                      for index in range(count)])
+
+    @asyncio.coroutine
+    def get_fields(self, entry_point, path):
+        """
+        List fields of a specific object (see Service.get_fields)
+        """
+        fields = yield From(self.protocol.getFields(entry_point, path))
+        raise Return(Service._parse_fields(fields))
+
+    @asyncio.coroutine
+    def get_methods(self, entry_point, path):
+        """
+        List methods of a specific object
+
+        Returns:
+        a dictionary with method names as keys and a list of tuples
+        of both modifiers and method index as value
+        """
+        methods = yield From(self.protocol.getMethods(entry_point, path))
+        result = {}
+        for index, method in enumerate(methods):
+            name, signature = method.split(':')
+            split = signature.split(' ')
+            result.setdefault(name, []).append((split[:-1], split[-1], index))
+        raise Return(result)
+
+    @asyncio.coroutine
+    def get_field(self, entry_point, path):
+        """
+        Get a specific field wrapped into an asynchronous object
+
+        Fields holding strings, integers or booleans are resolved to
+        Python values.
+        """
+        if entry_point is None or entry_point < 0:
+            raise Return(None)
+        types = yield From(self.protocol.getTypes(entry_point, path))
+        result = self._wrap(types, entry_point, path)
+        if isinstance(result, asyncio.Future) or asyncio.iscoroutine(result):
+            result = yield From(result)
+        raise Return(result)
+
+    @asyncio.coroutine
+    def get_class(self, classname):
+        """
+        Get a specific class object from class name
+        """
+        clazz = yield From(self.protocol.getClass(classname))
+        types = yield From(self.protocol.getTypes(clazz, []))
+        raise Return(self._wrap(types, clazz, [], unwrap=False))
+
+    @asyncio.coroutine
+    def get_value(self, entry_point, path, convert=None):
+        """
+        Get the remote value of a specific field
+
+        Keyword arguments:
+        entry_point -- the object entry point
+        path        -- path from the entry point to the object
+        convert     -- optional conversion applied to the raw value
+        """
+        value = yield From(self.protocol.getValue(entry_point, path))
+        raise Return(value if convert is None else convert(value))
+
+    def set_value(self, entry_point, path, value):
+        """
+        Set the remote value of a specific field
+
+        Returns:
+        a future resolved once the value is set
+        """
+        return self.protocol.setValue(entry_point, path, value)
+
+    def push(self, entry_point, path):
+        """
+        Push an object as an entry point
+
+        Returns:
+        a future holding the new entry point
+        """
+        return self.protocol.push(entry_point, path)
+
+    @asyncio.coroutine
+    def to_entry_point(self, var):
+        """
+        Take a Python typed object or an asynchronous object and get an
+        entry point for it
+
+        Returns:
+        the entry point, or None if the object cannot be pushed
+        """
+        if isinstance(var, AsyncObject):
+            result = yield From(var._getentrypoint())
+        elif type(var) is str:
+            result = yield From(self.protocol.pushString(var))
+        elif type(var) is int:
+            result = yield From(self.protocol.pushInt(var))
+        elif type(var) is bool:
+            result = yield From(self.protocol.pushBool(var))
+        else:
+            result = None
+        raise Return(result)
+
+    @asyncio.coroutine
+    def new_instance(self, entry_point, path, args):
+        """
+        Perform a class instanciation
+        """
+        arguments = yield From(asyncio.gather(
+            *[self.to_entry_point(arg) for arg in args]))
+        result = yield From(
+            self.protocol.newInstance(entry_point, path, list(arguments)))
+        result = yield From(self.get_field(result, []))
+        raise Return(result)
+
+    @asyncio.coroutine
+    def virtual(self, entry_point, path, method, args):
+        """
+        Perform a virtual method call
+
+        Arguments are pushed concurrently before the invocation.
+        """
+        arguments = yield From(asyncio.gather(
+            *[self.to_entry_point(arg) for arg in args]))
+        result = yield From(self.protocol.invokeMethodByName(
+            entry_point, path, method, list(arguments)))
+        result = yield From(self.get_field(result, []))
+        raise Return(result)
+
+
+class AsyncObject(object):
+    """
+    Asynchronous remote object
+
+    Attribute access returns a coroutine resolving to the field value or
+    to an asynchronous method, following the resolution rules of the
+    blocking Object class.
+    """
+
+    def __init__(self, service, types, entry_point, path=[]):
+        """
+        Initialize the object
+
+        Keyword arguments:
+        service     -- the asynchronous inspection service
+        types       -- list of remote types of the current object
+        entry_point -- the entry point number on the application side
+        path        -- the path on the application side
+        """
+        self._service = service
+        self._types = types
+        self._entry_point = entry_point
+        self._path = path
+        self._field_cache = None
+        self._method_cache = None
+
+    def __repr__(self):
+        """
+        Pretty print
+        """
+        return "<%s async object at %s.%s>" % (
+            self._types[0], self._entry_point, str(self._path))
+
+    def __getattr__(self, name):
+        """
+        Access an attribute of the current object
+
+        Returns:
+        a coroutine resolving to the attribute
+        """
+        if name[0] == '_':
+            raise AttributeError("Unknown attribute %s" % name)
+        return self._getattr(name)
+
+    @asyncio.coroutine
+    def _getfields(self):
+        if self._field_cache is None:
+            self._field_cache = yield From(
+                self._service.get_fields(self._entry_point, self._path))
+        raise Return(self._field_cache)
+
+    @asyncio.coroutine
+    def _getmethods(self):
+        if self._method_cache is None:
+            self._method_cache = yield From(
+                self._service.get_methods(self._entry_point, self._path))
+        raise Return(self._method_cache)
+
+    @asyncio.coroutine
+    def _getattr(self, name):
+        """
+        Resolve an attribute, fetching both listings concurrently
+        """
+        fields, methods = yield From(asyncio.gather(
+            self._getfields(), self._getmethods()))
+        if name in fields and name in methods:
+            raise MultipleDefinitionsError()
+        elif name in fields:
+            _, _, index = fields[name]
+            result = yield From(self._service.get_field(
+                self._entry_point, self._path + [index]))
+            raise Return(result)
+        elif name in methods:
+            raise Return(AsyncMethod(
+                self._service, self._entry_point, self._path, name))
+        raise AttributeError("Unknown attribute %s" % name)
+
+    @asyncio.coroutine
+    def _set(self, name, value):
+        """
+        Set a field of the current object
+
+        Keyword arguments:
+        name  -- the field name
+        value -- an asynchronous object or a Python value
+        """
+        fields = yield From(self._getfields())
+        if name not in fields:
+            raise AttributeError("Unknown field %s" % name)
+        entry_point = yield From(self._service.to_entry_point(value))
+        _, _, index = fields[name]
+        yield From(self._service.set_value(
+            self._entry_point, self._path + [index],
+            -1 if entry_point is None else entry_point))
+
+    @asyncio.coroutine
+    def _getentrypoint(self):
+        """
+        Get an entry point for the current object (see Object)
+        """
+        if len(self._path) > 0:
+            self._entry_point = yield From(
+                self._service.push(self._entry_point, self._path))
+            self._path = []
+        raise Return(self._entry_point)
+
+
+class AsyncMethod(object):
+    """
+    Asynchronous virtual method
+
+    Calling the method returns a coroutine resolving to the result.
+    """
+
+    def __init__(self, service, entry_point, path, method):
+        """
+        Initialize the method object
+
+        Keyword arguments:
+        service     -- the asynchronous inspection service
+        entry_point -- the entry point number on the application side
+        path        -- the path on the application side
+        method      -- the method name
+        """
+        self._service = service
+        self._entry_point = entry_point
+        self._path = path
+        self._method = method
+
+    def __call__(self, *args):
+        """
+        Invoke the method with the given arguments
+        """
+        return self._service.virtual(
+            self._entry_point, self._path, self._method, args)
+
+    def __repr__(self):
+        """
+        Pretty print
+        """
+        return "<async virtual method %s>" % self._method
+
+
+class AsyncApplication(object):
+    """
+    Asynchronous top abstraction level class for remote application access
+    """
+
+    def __init__(self, app, protocol):
+        """
+        Initialize the application over a connected protocol
+
+        Use the connect coroutine to get a ready to use instance.
+        """
+        self.app = app
+        self.protocol = protocol
+        self.service = AsyncService(protocol)
+        self.context = None
+
+    @classmethod
+    @asyncio.coroutine
+    def connect(cls, remote, app, loop=None, codec=None):
+        """
+        Connect to the remote application
+
+        Keyword arguments:
+        remote -- remote address and port
+        app    -- remote application name
+        loop   -- the event loop
+        codec  -- message codec name or instance
+        """
+        protocol = yield From(AsyncProtocol.connect(remote, app, loop, codec))
+        application = cls(app, protocol)
+        contexts = yield From(application.find('android.content.Context'))
+        application.context = contexts[0]
+        raise Return(application)
+
+    def close(self):
+        """
+        Disconnect from the remote application
+        """
+        self.protocol.close()
+
+    def get_entry_points(self):
+        """
+        List the application entry points
+        """
+        return self.service.get_entry_points()
+
+    @asyncio.coroutine
+    def find(self, classname):
+        """
+        Find entry points with a given class name
+        """
+        entry_points = yield From(self.get_entry_points())
+        raise Return([entry_point for entry_point in entry_points
+                      if entry_point is not None
+                      and instanceof(classname, entry_point)])
+
+    def get_class(self, classname):
+        """
+        Retrieve a Class object corresponding to a remote class
+        """
+        return self.service.get_class(classname)
@@ -0,0 +1,153 @@
+"""
+Array encoding
+
+Python sequences are pushed as Java arrays with a single pushArray call,
+taking a component type, an encoding and a payload:
+* 'base64' -- numeric arrays, as big endian binary values encoded in
+  base64, which avoids per element JSON overhead
+* 'json' -- boolean and string arrays, as a list of values
+* 'entry_points' -- object arrays, as a list of entry points
+
+Lists, tuples, array.array instances and NumPy arrays are supported.
+NumPy is not required, arrays are recognized by their dtype attribute.
+"""
+
+import sys
+import array
+import struct
+from base64 import b64encode
+
+# struct formats of numeric component types
+FORMATS = {
+    'byte': 'b',
+    'short': 'h',
+    'char': 'H',
+    'int': 'i',
+    'long': 'q',
+    'float': 'f',
+    'double': 'd',
+}
+
+# component types of array.array type codes
+TYPECODES = {
+    'b': 'byte',
+    'h': 'short',
+    'H': 'char',
+    'i': 'int',
+    'l': 'long',
+    'f': 'float',
+    'd': 'double',
+}
+
+# component types of NumPy dtypes, by kind and item size
+DTYPES = {
+    ('i', 1): 'byte',
+    ('i', 2): 'short',
+    ('u', 2): 'char',
+    ('i', 4): 'int',
+    ('i', 8): 'long',
+    ('f', 4): 'float',
+    ('f', 8): 'double',
+}
+
+# bounds of Java int and long values
+INT_MIN, INT_MAX = -2 ** 31, 2 ** 31 - 1
+LONG_MIN, LONG_MAX = -2 ** 63, 2 ** 63 - 1
+
+
+def is_array(var):
+    """
+    Check whether a Python object is pushed as an array
+    """
+    return isinstance(var, (list, tuple, array.array)) or \
+        hasattr(var, 'dtype') and hasattr(var, 'tolist')
+
+
+def is_bytes(var):
+    """
+    Check whether a Python object is pushed as a byte array
+    """
+    if isinstance(var, (bytearray, memoryview, buffer)):
+        return True
+    if isinstance(var, array.array):
+        return var.typecode == 'B'
+    if hasattr(var, 'dtype'):
+        return (var.dtype.kind, var.dtype.itemsize) == ('u', 1)
+    return False
+
+
+def component_type(values):
+    """
+    Guess the component type of a list of Python values
+
+    Returns:
+    a primitive type name, java.lang.String, or None for object arrays
+
+    Exceptions:
+    ValueError -- integers out of the range of Java longs
+    """
+    types = set(type(value) for value in values)
+    if types == set([bool]):
+        return 'boolean'
+    elif types and types <= set([int, long]):
+        if all(INT_MIN <= value <= INT_MAX for value in values):
+            return 'int'
+        if not all(LONG_MIN <= value <= LONG_MAX for value in values):
+            raise ValueError("Integer out of the range of Java long")
+        return 'long'
+    elif types and types <= set([int, long, float]):
+        return 'double'
+    elif types == set([str]):
+        return 'java.lang.String'
+    return None
+
+
+def pack(component, values):
+    """
+    Encode numeric values as big endian binary in base64
+    """
+    return b64encode(struct.pack(
+        '>%d%s' % (len(values), FORMATS[component]), *values))
+
+
+def encode(var):
+    """
+    Encode a Python sequence of values
+
+    Keyword arguments:
+    var -- a list, tuple, array.array or NumPy array
+
+    Returns:
+    a tuple of component type, encoding and payload, or None if the
+    sequence holds objects, which must be pushed as entry points
+
+    Exceptions:
+    ValueError -- integers out of the range of Java longs
+    """
+    if isinstance(var, array.array):
+        component = TYPECODES.get(var.typecode)
+        if component is None:
+            # unsigned int and long values may not fit the same Java type
+            return encode(var.tolist())
+        if var.itemsize != struct.calcsize(FORMATS[component]):
+            # platform dependent item size
+            return component, 'base64', pack(component, var.tolist())
+        data = array.array(var.typecode, var)
+        if sys.byteorder == 'little':
+            data.byteswap()
+        return component, 'base64', b64encode(data.tostring())
+    if hasattr(var, 'dtype'):
+        if var.dtype.kind == 'b':
+            return 'boolean', 'json', var.tolist()
+        component = DTYPES.get((var.dtype.kind, var.dtype.itemsize))
+        if component is None:
+            return encode(var.tolist())
+        data = var.astype(var.dtype.newbyteorder('>'))
+        return component, 'base64', b64encode(data.tobytes())
+    values = list(var)
+    component = component_type(values)
+    if component is None:
+        return None
+    elif component in FORMATS:
+        return component, 'base64', pack(component, values)
+    return component, 'json', values
@@ -0,0 +1,390 @@
+"""
+Client side caches
+
+Remote class metadata (field and method listings, type hierarchies) only
+depends on the concrete class of an object, so it is fetched and parsed
+once per class and per session, then shared by every object of that class.
+
+Metadata may also be persisted across sessions in a sqlite database, keyed
+by device fingerprint, application package and application version, so
+that reconnecting to the same application starts with a warm cache.
+
+Remote values (primitive wrappers) change over time, so caching them is
+governed by a freshness policy, see ValueCache.
+"""
+
+import os
+import re
+import time
+import json
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# value freshness policies
+ALWAYS, TTL, MANUAL = 'always', 'ttl', 'manual'
+
+# anonymous classes and lambdas
+ANONYMOUS = re.compile(r'\$\d|\$\$Lambda')
+
+
+class MetadataCache(object):
+    """
+    Per class metadata cache
+
+    Keeps parsed field and method tables and type hierarchies keyed by
+    concrete class name. Tables are shared among objects and must not be
+    altered.
+    """
+
+    # classes whose listings depend on the instance
+    UNCACHEABLE = ('java.lang.Class',)
+
+    # table kinds that are fetched from the remote end point, others are
+    # derived from these and never persisted
+    PERSISTENT = ('fields', 'methods', 'types')
+
+    def __init__(self):
+        """
+        Initialize an empty cache
+        """
+        self._lock = threading.Lock()
+        self._tables = {}
+        self._store = None
+        self._scope = None
+        # classes whose tables are never persisted (see exclude)
+        self._excluded = set()
+
+    def attach(self, store, scope):
+        """
+        Attach a persistent store
+
+        Tables already persisted for the scope are loaded right away, and
+        every table stored from now on is persisted as well.
+
+        Keyword arguments:
+        store -- a PersistentCache instance
+        scope -- tuple of device fingerprint, package and version
+        """
+        with self._lock:
+            self._store = store
+            self._scope = scope
+            for (kind, classname), table in store.load(scope).items():
+                self._tables.setdefault((kind, classname), table)
+            for (kind, classname), table in self._tables.items():
+                if self.persistent(kind, classname):
+                    store.save(scope, kind, classname, table)
+
+    def cacheable(self, classname):
+        """
+        Check whether the metadata of a class may be cached
+
+        Keyword arguments:
+        classname -- the concrete class name, may be None if unknown
+        """
+        return classname is not None and classname not in self.UNCACHEABLE
+
+    def persistent(self, kind, classname):
+        """
+        Check whether a table is persisted
+
+        Array and anonymous classes are numerous and seldom met again, so
+        their tables are only kept in memory, as well as excluded classes.
+        """
+        return kind in self.PERSISTENT and not classname.startswith('[') \
+            and ANONYMOUS.search(classname) is None \
+            and classname.split('$')[0] not in self._excluded
+
+    def exclude(self, classname):
+        """
+        Never persist the tables of a class and of its nested classes, and
+        drop those already persisted
+
+        Used for classes loaded by the client (macros), which may be built
+        again with another layout under the same name.
+        """
+        with self._lock:
+            self._excluded.add(classname)
+            if self._store is not None:
+                self._store.delete(self._scope, classname, nested=True)
+
+    def get(self, kind, classname):
+        """
+        Get a cached table
+
+        Keyword arguments:
+        kind      -- the table kind ('fields', 'methods', 'types'...)
+        classname -- the concrete class name
+
+        Returns:
+        the cached table, or None
+        """
+        table = self._tables.get((kind, classname))
+        if table is None and self._store is not None \
+                and self.persistent(kind, classname):
+            table = self._store.get(self._scope, kind, classname)
+            if table is not None:
+                self._tables[(kind, classname)] = table
+        return table
+
+    def set(self, kind, classname, table):
+        """
+        Store a table
+
+        Keyword arguments:
+        kind      -- the table kind ('fields', 'methods', 'types'...)
+        classname -- the concrete class name
+        table     -- the parsed table
+
+        Returns:
+        the stored table, which is the first one stored if several threads
+        fetched the same table concurrently
+        """
+        with self._lock:
+            if (kind, classname) in self._tables:
+                return self._tables[(kind, classname)]
+            self._tables[(kind, classname)] = table
+            if self._store is not None and self.persistent(kind, classname):
+                self._store.save(self._scope, kind, classname, table)
+            return table
+
+    def invalidate(self, classname=None):
+        """
+        Drop cached tables from memory
+
+        Persisted tables are kept, unless a class name is given.
+
+        Keyword arguments:
+        classname -- drop only the tables of this class, from memory and
+                     from the persistent store (default: all tables)
+        """
+        with self._lock:
+            if classname is None:
+                self._tables.clear()
+            else:
+                for key in [key for key in self._tables
+                            if key[1] == classname]:
+                    del self._tables[key]
+                if self._store is not None:
+                    self._store.delete(self._scope, classname)
+
+
+class ValueCache(object):
+    """
+    Remote value cache
+
+    Values are keyed by entry point and path, and served from the cache
+    according to the freshness policy:
+    * ALWAYS -- values are fetched on every access
+    * TTL    -- values are fetched again once older than the ttl
+    * MANUAL -- values are fetched once, until explicitly invalidated
+
+    Whatever the policy, values are read at most once while a snapshot is
+    active. With the ALWAYS policy, values are dropped once it ends.
+    """
+
+    def __init__(self, policy=ALWAYS, ttl=None):
+        """
+        Initialize an empty cache
+
+        Keyword arguments:
+        policy -- the freshness policy
+        ttl    -- value lifetime in seconds, for the TTL policy
+        """
+        self._lock = threading.Lock()
+        self._values = {}
+        self._snapshots = 0
+        self.configure(policy, ttl)
+
+    def configure(self, policy, ttl=None):
+        """
+        Change the freshness policy, dropping cached values
+
+        Exceptions:
+        ValueError -- unknown policy, or TTL policy without a ttl
+        """
+        if policy not in (ALWAYS, TTL, MANUAL):
+            raise ValueError("Unknown freshness policy %s" % policy)
+        if policy == TTL and ttl is None:
+            raise ValueError("The TTL policy requires a ttl")
+        self.policy = policy
+        self.ttl = ttl
+        self.invalidate()
+
+    def get(self, entry_point, path):
+        """
+        Get a cached value
+
+        Returns:
+        a tuple of a boolean telling whether the value was cached, and the
+        cached value
+        """
+        entry = self._values.get((entry_point, tuple(path)))
+        if entry is None:
+            return False, None
+        timestamp, value = entry
+        if self._snapshots or self.policy == MANUAL:
+            return True, value
+        if self.policy == TTL and time.time() - timestamp < self.ttl:
+            return True, value
+        return False, None
+
+    def set(self, entry_point, path, value):
+        """
+        Store a value, if the policy or an active snapshot allows it
+
+        Returns:
+        the value
+        """
+        if self._snapshots or self.policy != ALWAYS:
+            self._values[(entry_point, tuple(path))] = (time.time(), value)
+        return value
+
+    def invalidate(self, entry_point=None, path=None):
+        """
+        Drop cached values
+
+        Keyword arguments:
+        entry_point -- drop only values below this entry point
+                       (default: all values)
+        path        -- drop only values at or below this path
+        """
+        with self._lock:
+            if entry_point is None:
+                self._values.clear()
+                return
+            prefix = tuple(path or ())
+            for key in self._values.keys():
+                if key[0] == entry_point and key[1][:len(prefix)] == prefix:
+                    del self._values[key]
+
+    @contextmanager
+    def snapshot(self):
+        """
+        Read every value at most once within the context
+        """
+        with self._lock:
+            self._snapshots += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._snapshots -= 1
+            if not self._snapshots and self.policy == ALWAYS:
+                self.invalidate()
+
+
+class PersistentCache(object):
+    """
+    Persistent metadata store
+
+    Tables are stored as JSON documents in a sqlite database, keyed by
+    scope (device fingerprint, package and version), kind and class name.
+    """
+
+    def __init__(self, path=None):
+        """
+        Open the store, creating it if necessary
+
+        Keyword arguments:
+        path -- path of the database (default: metadata.sqlite in the user
+                cache directory)
+        """
+        if path is None:
+            path = os.path.join(self.default_directory(), 'metadata.sqlite')
+        directory = os.path.dirname(os.path.abspath(path))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS metadata ("
+                "device TEXT, package TEXT, version TEXT, kind TEXT, "
+                "classname TEXT, data TEXT, "
+                "PRIMARY KEY (device, package, version, kind, classname))")
+
+    @staticmethod
+    def default_directory():
+        """
+        Get the user cache directory for gadget
+        """
+        base = os.environ.get('XDG_CACHE_HOME') or \
+            os.path.join(os.path.expanduser('~'), '.cache')
+        return os.path.join(base, 'gadget')
+
+    @staticmethod
+    def _decode(kind, data):
+        """
+        Restore the tuples of a table decoded from JSON
+        """
+        table = json.loads(data)
+        if kind == 'fields':
+            return dict((name, tuple(field)) for name, field in table.items())
+        elif kind == 'methods':
+            return dict((name, [tuple(method) for method in methods])
+                        for name, methods in table.items())
+        elif kind == 'types':
+            return tuple(table)
+        return table
+
+    def load(self, scope):
+        """
+        Load every table of a scope
+
+        Returns:
+        a dictionary with (kind, class name) tuples as keys and tables
+        as values
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT kind, classname, data FROM metadata "
+                "WHERE device = ? AND package = ? AND version = ?",
+                scope).fetchall()
+        return dict(((kind, classname), self._decode(kind, data))
+                    for kind, classname, data in rows)
+
+    def get(self, scope, kind, classname):
+        """
+        Load a single table
+
+        Returns:
+        the table, or None if not persisted
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT data FROM metadata WHERE device = ? AND package = ? "
+                "AND version = ? AND kind = ? AND classname = ?",
+                tuple(scope) + (kind, classname)).fetchone()
+        return None if row is None else self._decode(kind, row[0])
+
+    def save(self, scope, kind, classname, table):
+        """
+        Persist a table
+        """
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO metadata VALUES (?, ?, ?, ?, ?, ?)",
+                tuple(scope) + (kind, classname, json.dumps(table)))
+
+    def delete(self, scope, classname, nested=False):
+        """
+        Drop every table of a class
+
+        Keyword arguments:
+        nested -- drop the tables of its nested classes as well
+        """
+        with self._lock, self._db:
+            self._db.execute(
+                "DELETE FROM metadata WHERE device = ? AND package = ? "
+                "AND version = ? AND (classname = ? OR "
+                "(? AND substr(classname, 1, ?) = ?))",
+                tuple(scope) + (classname, nested, len(classname) + 1,
+                                classname + '$'))
+
+    def close(self):
+        """
+        Close the database
+        """
+        self._db.close()
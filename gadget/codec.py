@@ -0,0 +1,135 @@
+"""
+Message codecs
+
+Codecs turn protocol messages (lists and dictionaries of basic types)
+into frame payloads and back. The standard json module is used by
+default, which keeps the wire format of the remote end point. Faster JSON
+implementations produce equivalent JSON documents and may be used with
+any end point, while msgpack requires an end point that accepts it.
+
+Optional codecs are only available if the matching module is installed:
+* orjson and ujson for fast JSON encoding
+* msgpack for binary encoding
+"""
+
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+class JSONCodec(object):
+    """
+    Standard JSON codec, matching the reference wire format byte for byte
+    """
+
+    name = 'json'
+
+    def encode(self, message):
+        return json.dumps(message)
+
+    def decode(self, payload):
+        return json.loads(payload)
+
+
+class OrJSONCodec(object):
+    """
+    JSON codec based on orjson
+    """
+
+    name = 'orjson'
+
+    def encode(self, message):
+        return orjson.dumps(message)
+
+    def decode(self, payload):
+        return orjson.loads(payload)
+
+
+class UJSONCodec(object):
+    """
+    JSON codec based on ujson
+    """
+
+    name = 'ujson'
+
+    def encode(self, message):
+        return ujson.dumps(message)
+
+    def decode(self, payload):
+        return ujson.loads(payload)
+
+
+class MsgpackCodec(object):
+    """
+    Binary codec based on msgpack
+    """
+
+    name = 'msgpack'
+
+    def encode(self, message):
+        # messages hold no binary data, so that str (bytes on Python 2)
+        # values are packed as strings, not as bin the end point would
+        # decode to bytes
+        return msgpack.packb(message, use_bin_type=False)
+
+    def decode(self, payload):
+        return msgpack.unpackb(payload, raw=False)
+
+
+# every codec, along with the module it depends on
+CODECS = [
+    (JSONCodec, json),
+    (OrJSONCodec, orjson),
+    (UJSONCodec, ujson),
+    (MsgpackCodec, msgpack),
+]
+
+# the default codec instance
+DEFAULT = JSONCodec()
+
+
+def available():
+    """
+    List the names of the codecs that may be used
+    """
+    return [codec.name for codec, module in CODECS if module is not None]
+
+
+def get_codec(codec=None):
+    """
+    Get a codec instance
+
+    Keyword arguments:
+    codec -- a codec name, a codec instance, 'fastjson' for the fastest
+             available JSON codec, or None for the default codec
+
+    Exceptions:
+    ValueError -- unknown or unavailable codec
+    """
+    if codec is None:
+        return DEFAULT
+    elif not isinstance(codec, basestring):
+        return codec
+    elif codec == 'fastjson':
+        for name in ('orjson', 'ujson', 'json'):
+            if name in available():
+                return get_codec(name)
+    for clazz, module in CODECS:
+        if clazz.name == codec:
+            if module is None:
+                raise ValueError("Codec %s is not available" % codec)
+            return clazz()
+    raise ValueError("Unknown codec %s" % codec)
@@ -0,0 +1,147 @@
+"""
+Deferred remote results
+
+Pipelined and batched remote calls do not return their result right away.
+They return futures instead, which are resolved once the matching answer
+is received from the remote end point. Futures may be chained so that the
+wrapping of a remote result is deferred as well.
+"""
+
+
+class Future(object):
+    """
+    Result of a deferred remote call
+
+    The future is resolved by its owner (a protocol or a batch) as soon as
+    the matching answer is received. Asking for the result blocks until
+    then, the owner is simply asked to wait for the future.
+    """
+
+    def __init__(self, owner):
+        """
+        Initialize the future
+
+        Keyword arguments:
+        owner -- the object in charge of resolving the future, which must
+                 provide a wait(future) method
+        """
+        self._owner = owner
+        self._done = False
+        self._result = None
+        self._error = None
+
+    def __repr__(self):
+        """
+        Pretty print
+        """
+        return "<Future %s>" % ("done" if self._done else "pending")
+
+    def _set_result(self, result):
+        self._result = result
+        self._done = True
+
+    def _set_error(self, error):
+        self._error = error
+        self._done = True
+
+    def _source(self):
+        """
+        Get the future actually waiting for a remote answer
+        """
+        return self
+
+    def done(self):
+        """
+        Check whether the answer was already received
+        """
+        return self._done
+
+    def result(self):
+        """
+        Get the remote result, waiting for it if necessary
+
+        Exceptions:
+        RuntimeError -- the remote method failed
+        """
+        if not self._done:
+            self._owner.wait(self)
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+    def then(self, callback):
+        """
+        Chain a callback to the future
+
+        Keyword arguments:
+        callback -- function applied to the result
+
+        Returns:
+        a future holding the callback result
+        """
+        return Derived(self, callback)
+
+
+class Derived(Future):
+    """
+    Future computed from another future
+
+    The callback is only applied when the result is requested. If the
+    callback itself returns a future, that future is resolved as well.
+    """
+
+    def __init__(self, parent, callback):
+        """
+        Initialize the derived future
+
+        Keyword arguments:
+        parent   -- the future the result is computed from
+        callback -- function applied to the parent result
+        """
+        Future.__init__(self, None)
+        self._parent = parent
+        self._callback = callback
+
+    def _source(self):
+        return self._parent._source()
+
+    def done(self):
+        return self._done or self._parent.done()
+
+    def result(self):
+        if not self._done:
+            try:
+                self._set_result(resolved(self._callback(self._parent.result())))
+            except RuntimeError as error:
+                self._set_error(error)
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+
+def resolved(value):
+    """
+    Get the actual value behind a possible future
+
+    Keyword arguments:
+    value -- a future or any value
+    """
+    while isinstance(value, Future):
+        value = value.result()
+    return value
+
+
+def then(value, callback):
+    """
+    Apply a callback to a value that may be a future
+
+    Keyword arguments:
+    value    -- a future or any value
+    callback -- function applied to the actual value
+
+    Returns:
+    the callback result, deferred if the value is a future
+    """
+    if isinstance(value, Future):
+        return value.then(callback)
+    return callback(value)
@@ -0,0 +1,214 @@
+"""
+Remote entry point lifecycle
+
+Every push, instanciation or method call allocates a new entry point on
+the remote side. Entry points allocated by the client are reference
+counted through the mapped objects wrapping them (fields of an object
+share its entry point), and entry points used only as call arguments are
+dropped once the call is performed. Unreferenced entry points are
+released in batches, with a single remote call for many entry points.
+"""
+
+import threading
+import weakref
+from contextlib import contextmanager
+
+from futures import Future
+
+
+class EntryPointTracker(object):
+    """
+    Reference tracker for client allocated entry points
+
+    The tracker only collects entry points to release, sending the
+    release request is left to the service, at points where no call may
+    still depend on them.
+    """
+
+    def __init__(self, threshold=64):
+        """
+        Initialize the tracker
+
+        Keyword arguments:
+        threshold -- count of candidate entry points triggering a release
+        """
+        self.threshold = threshold
+        self.supported = True
+        self.released = 0
+        # garbage collection callbacks may run while the lock is held
+        self._lock = threading.RLock()
+        # live wrapper count per owned entry point
+        self._owners = {}
+        # weak references to wrappers, by id
+        self._refs = {}
+        # allocated entry points not received yet
+        self._unresolved = []
+        # entry points that may be released if unreferenced
+        self._candidates = []
+        # count of active holds, deferring releases
+        self._holds = 0
+
+    def own(self, entry_point):
+        """
+        Record an entry point allocated by the client
+
+        Keyword arguments:
+        entry_point -- the entry point, or a future for it
+        """
+        if not self.supported:
+            return
+        with self._lock:
+            if isinstance(entry_point, Future):
+                self._unresolved.append(entry_point)
+            elif entry_point >= 0:
+                self._owners.setdefault(entry_point, 0)
+
+    def _settle(self):
+        """
+        Record the allocated entry points received since the last call
+
+        Must be called with the lock held.
+        """
+        pending = []
+        for future in self._unresolved:
+            if not future.done():
+                pending.append(future)
+                continue
+            try:
+                entry_point = future.result()
+            except RuntimeError:
+                continue
+            if entry_point >= 0:
+                self._owners.setdefault(entry_point, 0)
+        self._unresolved = pending
+
+    def track(self, obj):
+        """
+        Count a mapped object or a method as a reference to its entry point
+        """
+        if not self.supported:
+            return
+        with self._lock:
+            self._settle()
+            entry_point = obj._entry_point
+            if entry_point not in self._owners:
+                return
+            self._owners[entry_point] += 1
+            ref = weakref.ref(obj, self._collected)
+            self._refs[id(ref)] = (ref, entry_point)
+
+    def _collected(self, ref):
+        """
+        Drop a reference once its object is garbage collected
+
+        May be called from any thread, at any time: the entry point is
+        only marked as a candidate for release.
+        """
+        with self._lock:
+            _, entry_point = self._refs.pop(id(ref), (None, None))
+            if entry_point in self._owners:
+                self._owners[entry_point] -= 1
+                if self._owners[entry_point] == 0:
+                    self._candidates.append(entry_point)
+
+    def discard(self, entry_points):
+        """
+        Mark entry points used as call arguments as candidates for release
+
+        Entry points still referenced by a mapped object are kept.
+
+        Keyword arguments:
+        entry_points -- a list of entry points or futures for them
+        """
+        if not self.supported:
+            return
+        with self._lock:
+            # inline values are not entry points
+            self._candidates.extend(
+                entry_point for entry_point in entry_points
+                if not isinstance(entry_point, dict))
+
+    def owned(self, entry_point):
+        """
+        Check whether an entry point was allocated by the client and is
+        still alive
+        """
+        return entry_point in self._owners
+
+    @contextmanager
+    def hold(self):
+        """
+        Defer releases within the context
+
+        Used while a call is prepared, so that entry points the call
+        depends on are not released between pushing its arguments and
+        performing it.
+        """
+        with self._lock:
+            self._holds += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._holds -= 1
+
+    def collect(self, force=False):
+        """
+        Collect unreferenced entry points to release
+
+        Nothing is collected while a hold is active.
+
+        Keyword arguments:
+        force -- collect even if the threshold was not reached
+
+        Returns:
+        a sorted list of entry points, which are forgotten by the tracker
+        """
+        with self._lock:
+            if self._holds or (
+                    not force and len(self._candidates) < self.threshold):
+                return []
+            self._settle()
+            candidates, self._candidates = self._candidates, []
+            entry_points = set()
+            for entry_point in candidates:
+                if isinstance(entry_point, Future):
+                    if not entry_point.done():
+                        self._candidates.append(entry_point)
+                        continue
+                    try:
+                        entry_point = entry_point.result()
+                    except RuntimeError:
+                        continue
+                if self._owners.get(entry_point) == 0:
+                    del self._owners[entry_point]
+                    entry_points.add(entry_point)
+            self.released += len(entry_points)
+            return sorted(entry_points)
+
+    def disable(self):
+        """
+        Stop tracking, when the remote end point cannot release
+        """
+        with self._lock:
+            self.supported = False
+            self._owners.clear()
+            self._refs.clear()
+            self._unresolved = []
+            self._candidates = []
+
+    def stats(self):
+        """
+        Get entry point counters
+
+        Returns:
+        a dictionary with the count of live entry points, of entry points
+        waiting to be released, and of released entry points
+        """
+        with self._lock:
+            return {
+                'live': len(self._owners),
+                'pending': len(self._candidates),
+                'released': self.released,
+                'supported': self.supported,
+            }
@@ -50,6 +50,13 @@ Applying the resolution rules results in:
 * An instance of OtherImplementation is mapped to ThingObject
 """
 
+from futures import resolved
+
+
+# attribute kinds, see Service.get_attributes
+FIELD, METHOD, AMBIGUOUS = 'field', 'method', 'ambiguous'
+
+
 class MultipleDefinitionsError(Exception):
     """
     Multiple definitions of a single name found
@@ -68,11 +75,23 @@ class Registry(object):
 
     Keeps a record of every mapped class and performs mapping
     resolution.
+
+    Remote type lists contain the class hierarchy up to java.lang.Object,
+    followed by the implemented interfaces. They do not tell which class
+    declares each interface, so interfaces are considered as declared by
+    the concrete type itself: they are less specific than the type, but
+    more specific than its parent types.
+
+    Resolutions are memoized per type list, and the memo is dropped
+    whenever a new mapping is registered.
     """
 
     # the registry itself
     mappings = dict()
 
+    # resolved mappings, keyed by type tuples
+    resolved = dict()
+
     @classmethod
     def register(cls, clazz, classname):
         """
@@ -82,6 +101,25 @@ class Registry(object):
         classname -- the mapped Java class name
         """
         cls.mappings[classname] = clazz
+        cls.resolved.clear()
+
+    @staticmethod
+    def order(classnames):
+        """
+        Sort a remote type list from the most to the least specific type
+
+        Keyword arguments:
+        classnames -- list of Java class names, as listed by the remote end
+                      point
+
+        Returns:
+        the sorted list of class names
+        """
+        classnames = list(classnames)
+        if len(classnames) < 2 or 'java.lang.Object' not in classnames:
+            return classnames
+        split = classnames.index('java.lang.Object') + 1
+        return classnames[:1] + classnames[split:] + classnames[1:split]
 
     @classmethod
     def resolve(cls, classnames):
@@ -97,8 +135,14 @@ class Registry(object):
         Exceptions:
         ValueError -- no available mapping (should never happen)
         """
-        for classname in classnames:
+        key = classnames if type(classnames) is tuple else tuple(classnames)
+        try:
+            return cls.resolved[key]
+        except KeyError:
+            pass
+        for classname in cls.order(classnames):
             if classname in cls.mappings:
+                cls.resolved[key] = cls.mappings[classname]
                 return cls.mappings[classname]
         # should never raise since Object is registered for java.lang.object
         raise ValueError("No available mapping")
@@ -133,6 +177,23 @@ def maptype(*classnames):
     return decorator
 
 
+class Accessor(object):
+    """
+    Attribute access helper
+
+    Forwards attribute lookups to a lookup function of a remote object,
+    see Object._M and Object._P.
+    """
+
+    __slots__ = ('_lookup',)
+
+    def __init__(self, lookup):
+        self._lookup = lookup
+
+    def __getattr__(self, name):
+        return self._lookup(name)
+
+
 @maptype('java.lang.Object')
 class Object(object):
     """
@@ -146,15 +207,28 @@ class Object(object):
 
     Some cache dictionaries are stored per instance:
     * the method cache is a dictionary, keys are method names, values
-      are lists of modified method objects (multiple concrete methods)
+      are lists of modified method signatures (multiple concrete methods)
     * class cache is a dictionary, keys are class names, values are
       modified class objects
     * field cache is a dictionary, keys are field names, values are
-      modified objects
+      modified field indices
+    * field object cache is a dictionary, keys are field names, values
+      are the field objects generated so far
     (a modified object is a couple of modifiers and modified object, modifiers
     may be public, protected, private, static, etc. they are stored as strings)
+
+    Field and method caches, along with the attribute index mapping every
+    attribute name to its kind and field index, are shared by every object
+    of the same concrete class (see Service.metadata), hence they must not
+    be altered.
+
+    Objects use slots to keep many wrappers cheap, mapping classes holding
+    more state should declare their own slots.
     """
 
+    __slots__ = ('_service', '_entry_point', '_types', '_path',
+                 '_field_cache', '_field_objects', '_method_cache',
+                 '_attributes', '__weakref__')
 
     def __init__(self, service, types, entry_point, path=[]):
         """
@@ -173,15 +247,32 @@ class Object(object):
         self._types = types
         self._path = path
         self._field_cache = None
+        # field objects are created when needed
+        self._field_objects = None
         self._method_cache = None
-        self._methods = type('', (object,), {'__getattr__': self._getmethod})()
-        # self._methods alias (short form)
-        self._M = self._methods
-        self._properties = type('', (object,), {'__getattr__': self._getfield})()
-        # self._properties alias (short form)
-        self._P = self._properties
+        self._attributes = None
         self._refresh()
 
+    @property
+    def _methods(self):
+        """
+        Method only access
+        """
+        return Accessor(self._getmethod)
+
+    # self._methods alias (short form)
+    _M = _methods
+
+    @property
+    def _properties(self):
+        """
+        Field only access
+        """
+        return Accessor(self._getfield)
+
+    # self._properties alias (short form)
+    _P = _properties
+
     def __repr__(self):
         """
         Pretty print
@@ -206,7 +297,7 @@ class Object(object):
 
         List inner fields and methods with full signature as a dictionary.
         """
-        return self._getfields().keys() + self._getmethods().keys()
+        return self._getattributes().keys()
 
     def __setattr__(self, name, value):
         """
@@ -218,24 +309,22 @@ class Object(object):
         if name[0] == '_':
             object.__setattr__(self, name, value)
         else:
-            field = self._getfield(name)
-            fields = self._service.get_fields(
-                self._entry_point, self._path)
-            if name in fields and field:
-                if not isinstance(value, Object):
-                    value = self._service.to_object(value)
-                    if value is None:
-                        value = Registry.resolve(['null'])()
-                _, _, index = fields[name]
-                self._service.set_value(
-                    self._entry_point,
-                    self._path + [index],
-                    value._getentrypoint()
-                )
-                field._refresh()
-
-                # Refresh the field cache
-                self._field_cache[name] = fields[name]
+            fields = self._getfields()
+            if name in fields:
+                with self._service.holding():
+                    entry_point, = self._service.to_arguments([value])
+                    if entry_point is None:
+                        entry_point = Registry.resolve(
+                            ['null'])()._getentrypoint()
+                    _, _, index = fields[name]
+                    self._service.set_value(
+                        self._entry_point,
+                        self._path + [index],
+                        entry_point
+                    )
+                # the field object is generated again on next access
+                if self._field_objects is not None:
+                    self._field_objects.pop(name, None)
 
     def __getattr__(self, name):
         """
@@ -247,22 +336,26 @@ class Object(object):
         * methods (no matter their visibility either)
         * classes
 
-        Cache is refreshed using lazy mechanisms, ie. the method cache
-        will not be refreshed if a field matches the attribute name.
+        The attribute is looked up in the class attribute index. Once the
+        index is known, methods need no remote call, and fields a type
+        lookup, skipped for primitive fields whose type was met before and
+        pipelined with the value lookup for String, Integer and Boolean
+        fields (see Service.get_field).
         Methods returned as attributes are virtual methods: virtual method
         resolution will be performed on the Java side whenever the method
-        object is called.
-        """
-        # check if at least a field AND a method both match
-        if (self._getfield(name) is not None) and (self._getmethod(name) is not None):
-            raise MultipleDefinitionsError()
-        else:
-            field = self._getfield(name)
-            if field is not None:
-                return field
-            method = self._getmethod(name)
-            if method is not None:
-                return method
+        object is called. Null fields are returned as None.
+        """
+        attributes = self._getattributes()
+        if name in attributes:
+            kind, _ = attributes[name]
+            # check if at least a field AND a method both match
+            if kind == AMBIGUOUS:
+                raise MultipleDefinitionsError()
+            elif kind == FIELD:
+                return self._getfield(name)
+            else:
+                return Method(self._service, self._entry_point, self._path,
+                              name, classname=self._types[0])
         # Nothing found, raise error
         raise AttributeError("Unknown attribute %s" % name)
 
@@ -281,8 +374,8 @@ class Object(object):
         """
         # if the field list needs to be refreshed
         if self._field_cache is None:
-            self._field_cache = self._service.get_fields(
-                self._entry_point, self._path)
+            self._field_cache = resolved(self._service.get_fields(
+                self._entry_point, self._path, self._types[0]))
         return self._field_cache
 
 
@@ -293,29 +386,44 @@ class Object(object):
         There is no virtual field resolution mechanism in Java, so cache is
         simply refreshed and the matching field is returned if available.
         The cache is refreshed in two steps:
-        * the list of fields is stored as keys (the value is None)
+        * the list of fields is stored as keys (the value is the field index)
         * the field Object is generated when needed
         """
         # if the attribute is a field
         if name in self._getfields():
-            modifiers, type_, field = self._field_cache[name]
+            if self._field_objects is None:
+                self._field_objects = {}
+            field = self._field_objects.get(name)
             # if the specific field needs to be created
-            if type(field) is int:
-                field = self._service.get_field(
-                    self._entry_point, self._path + [field])
-                self._field_cache[name] = (modifiers, type_, field)
+            if field is None:
+                _, type_, index = self._field_cache[name]
+                field = resolved(self._service.get_field(
+                    self._entry_point, self._path + [index], type_))
+                if field is None:
+                    return None
+                self._field_objects[name] = field
             # otherwise just refresh it
-            field._refresh()
+            else:
+                field._refresh()
             return field
 
+    def _getattributes(self):
+        """
+        Retrieve the attribute index of the remote object
+        """
+        if self._attributes is None:
+            self._attributes = self._service.get_attributes(
+                self._entry_point, self._path, self._types[0])
+        return self._attributes
+
     def _getmethods(self):
         """
         Retrieve the remote object's methods
         """
         # if the method list needs to be refreshed
         if self._method_cache is None:
-            self._method_cache = self._service.get_methods(
-                self._entry_point, self._path)
+            self._method_cache = resolved(self._service.get_method_table(
+                self._entry_point, self._path, self._types[0]))
         return self._method_cache
 
 
@@ -330,7 +438,8 @@ class Object(object):
         if name in self._getmethods():
             # virtual method is simply a Method object with a string method
             # instead of integer method id
-            return Method(self._service, self._entry_point, self._path, name)
+            return Method(self._service, self._entry_point, self._path,
+                          name, classname=self._types[0])
 
     def _getentrypoint(self):
         """
@@ -340,9 +449,11 @@ class Object(object):
         value. Otherwise, it is necessary to first push the object.
         """
         if len(self._path) > 0:
-            self._entry_point = self._service.push(
-                self._entry_point, self._path)
+            self._entry_point = resolved(self._service.push(
+                self._entry_point, self._path))
             self._path = []
+            # the object now references the pushed entry point
+            self._service.lifecycle.track(self)
         return self._entry_point
 
 
@@ -374,7 +485,11 @@ class Method(object):
     method invocation.
     """
 
-    def __init__(self, service, entry_point, path, method, signature = ""):
+    __slots__ = ('_service', '_entry_point', '_path', '_method', '_signature',
+                 '_classname', '__weakref__')
+
+    def __init__(self, service, entry_point, path, method, signature = "",
+                 classname=None):
         """
         Initialize the method object
 
@@ -383,17 +498,26 @@ class Method(object):
         performed when invoked. If the method is a method identifier
         (as integer), then the method object behaves like a concrete method.
 
+        When the concrete class of the object is known, calls to a virtual
+        method are turned into concrete calls whenever the overload
+        matching the arguments can be resolved locally (see
+        Service.get_overload).
+
         Keyword arguments:
         service     -- the inspection service
         entry_point -- the entry point number on the application side
         path        -- the path on the application side
         method      -- represented method
+        classname   -- the object concrete class name
         """
         self._service = service
         self._entry_point = entry_point
         self._path = path
         self._method = method
         self._signature = signature
+        self._classname = classname
+        # the receiver entry point must live as long as the method
+        service.lifecycle.track(self)
 
     def __call__(self, *args):
         """
@@ -402,18 +526,24 @@ class Method(object):
         Arguments may be Object instances or base types that will be
         cast as Object instances before actual method invocation.
         """
-        # list of actual sent arguments
-        objects = [arg if isinstance(arg, Object)
-                   else self._service.to_object(arg)
-                   for arg in args]
-        arguments = [arg._getentrypoint() if arg is not None else None for arg in objects]
-        # if the method is a virtual method
-        if type(self._method is str):
-            entry_point = self._service.virtual(
-                self._entry_point, self._path, self._method, arguments)
-        else:
-            entry_point = self._service.invoke(
-                self._entry_point, self._path, self._method, arguments)
+        method = self._method
+        # resolve the overload locally if possible
+        if type(method) is str and self._classname is not None:
+            index = self._service.get_overload(
+                self._entry_point, self._path, self._classname, method, args)
+            if index is not None:
+                method = index
+        # pushed arguments must live until the call is performed
+        with self._service.holding():
+            # list of actual sent arguments
+            arguments = self._service.to_arguments(args)
+            # if the method is a virtual method
+            if type(method) is str:
+                entry_point = self._service.virtual(
+                    self._entry_point, self._path, method, arguments)
+            else:
+                entry_point = self._service.invoke(
+                    self._entry_point, self._path, method, arguments)
         # return the result wrapped in an Object instance
         return entry_point
 
@@ -5,7 +5,7 @@ Gadget protocol basically relies on:
 * IP for the routing layer
 * TCP for the transport layer
 * Homemade protocol for data transfer
-* JSON for most of the encoding
+* JSON for most of the encoding (see gadget.codec for alternatives)
 
 Using a homemade protocol was a tough choice. Yet, no other protocol
 like XML-RPC or usual SOAP implementations would allow full duplex
@@ -17,14 +17,30 @@ Gadget protocol messages are defined as follow.
  +-------------+-------------------------- - - - -----------------+
  | length      |                  JSON payload                    |
  +-------------+-------------------------- - - - -----------------+
+
+Framing itself is handled by the gadget.transport module.
 """
 
-import socket
+import os
 import json
-import struct
-
+import mmap
+import time
+import socket
+import hashlib
+import threading
 from base64 import b64encode
-from mapping import Registry, Method, instanceof
+from collections import deque
+from contextlib import contextmanager
+from Queue import Queue
+from mapping import Registry, Object, Method
+from mapping import FIELD, METHOD, AMBIGUOUS
+from futures import Future, resolved, then
+from transport import Transport
+from codec import DEFAULT, get_codec
+from cache import MetadataCache, PersistentCache, ValueCache, ALWAYS
+from lifecycle import EntryPointTracker
+from stats import Metrics
+import arrays
 from types import Null
 
 class Protocol(object):
@@ -33,78 +49,787 @@ class Protocol(object):
 
     Provides simple access to remote inspection service methods by simply
     proxifying them through the dedicated protocol.
+
+    The connection is guarded by a lock, so that a protocol instance may
+    be shared among threads without corrupting the message framing.
+
+    The count of requests sent so far is available as the requests
+    attribute. Calls are recorded in the metrics attribute, unless it is
+    None (see gadget.stats).
     """
 
-    def __init__(self, remote, app):
+    def __init__(self, remote, app, codec=None, metrics=None):
         """
         Connect to the remote end point
 
         Keyword arguments:
-        remote -- address and port of the remote end point
-        app    -- inspected application package
+        remote  -- address and port of the remote end point
+        app     -- inspected application package
+        codec   -- message codec name or instance (default: standard JSON)
+        metrics -- a gadget.stats.Metrics instance recording the calls
+                   (default: calls are not recorded)
 
         Exceptions:
-        IOError -- connection to the remote end point failed
+        IOError    -- connection to the remote end point failed
+        ValueError -- unknown or unavailable codec
         """
         self._app = app
-        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self._socket.connect(remote)
+        self._codec = get_codec(codec)
+        self._pending = deque()
+        self._lock = threading.RLock()
+        self.requests = 0
+        self.metrics = metrics
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.connect(remote)
+        self._transport = Transport(sock)
         self.connectApp()
 
     def __del__(self):
         """
         Disconnect the protocol instance
         """
-        self._socket.close()
+        self._transport.close()
 
     @staticmethod
-    def _call(socket, app, name, arguments):
+    def _encode(app, name, arguments, codec=DEFAULT):
         """
-        Proxify a call to the remote end point and parse the result
+        Build a request payload
 
         Keyword arguments:
+        app       -- inspected application package
         name      -- name of the remote method
         arguments -- list of arguments for the method
+        codec     -- the message codec
+        """
+        return codec.encode([app, name] + list(arguments))
+
+    @staticmethod
+    def _decode(payload, codec=DEFAULT):
         """
-        # send the request
-        request = json.dumps([app, name] + list(arguments))
-        message = struct.pack('>I', len(request)) + request
-
-        while len(message) > 0:
-            message = message[socket.send(message):]
-
-        # wait for the answer
-        length = socket.recv(4)
-        assert len(length) == 4, IOError("Connection error while receiving")
-        length = struct.unpack('>I', length)[0]
-        # receive as many bytes from the tcp socket
-        result = ''
-        while len(result) < length:
-            recv = socket.recv(length - len(result))
-            if len(recv) == 0:
-                break
-            result += recv
-        # always check the message length
-        assert len(result) == length, IOError("Wrong message length")
-        # decode the answer
-        response = json.loads(result)
+        Parse an answer payload (without its length header)
+
+        Exceptions:
+        RuntimeError -- the remote method failed
+        """
+        response = codec.decode(payload)
         if not response['success']:
             raise RuntimeError("Remote error, %s" % response['response'])
         return None if 'response' not in response else response['response']
 
+    @staticmethod
+    def _send(transport, app, name, arguments, codec=DEFAULT):
+        """
+        Send a request to the remote end point without waiting for the answer
+
+        Keyword arguments:
+        transport -- the framed transport
+        name      -- name of the remote method
+        arguments -- list of arguments for the method
+        codec     -- the message codec
+        """
+        transport.send(Protocol._encode(app, name, arguments, codec))
+
+    @staticmethod
+    def _receive(transport, codec=DEFAULT):
+        """
+        Receive and parse the next answer from the remote end point
+
+        Answers are sent back in the same order as the requests, so the
+        first answer received always matches the oldest unanswered request.
+
+        Exceptions:
+        RuntimeError -- the remote method failed
+        IOError      -- the connection was closed
+        """
+        return Protocol._decode(transport.receive(), codec)
+
+    @staticmethod
+    def _call(transport, app, name, arguments, codec=DEFAULT):
+        """
+        Proxify a call to the remote end point and parse the result
+
+        Keyword arguments:
+        transport -- the framed transport
+        name      -- name of the remote method
+        arguments -- list of arguments for the method
+        codec     -- the message codec
+        """
+        Protocol._send(transport, app, name, arguments, codec)
+        return Protocol._receive(transport, codec)
+
+    def _exchange(self, name, arguments):
+        """
+        Perform a call, recording it if metrics are enabled
+
+        Must be called with the lock held, once pending answers are
+        received.
+        """
+        if self.metrics is None:
+            return self._call(self._transport, self._app, name, arguments,
+                              self._codec)
+        payload = self._encode(self._app, name, arguments, self._codec)
+        start = time.time()
+        self._transport.send(payload)
+        return self._measure(name, start, len(payload))
+
+    def _measure(self, name, start, sent):
+        """
+        Receive and parse the next answer, recording the call
+
+        Keyword arguments:
+        name  -- name of the remote method
+        start -- time the request was sent at
+        sent  -- size of the request payload
+
+        Exceptions:
+        RuntimeError -- the remote method failed
+        """
+        answer = self._transport.receive()
+        latency = time.time() - start
+        try:
+            result = self._decode(answer, self._codec)
+        except RuntimeError:
+            self.metrics.record(name, latency, sent, len(answer), True)
+            raise
+        self.metrics.record(name, latency, sent, len(answer))
+        return result
+
+    @staticmethod
+    def _stream(app, name, arguments, data, codec=DEFAULT):
+        """
+        Build a request payload in parts, the last argument being binary
+        data sent as base64
+
+        Payloads of the JSON codecs are produced chunk by chunk, so that
+        large data is never encoded as a whole. Other codecs, including
+        custom codec instances, encode the whole message: the data is then
+        encoded in base64 at once, but never copied beforehand.
+
+        Keyword arguments:
+        app       -- inspected application package
+        name      -- name of the remote method
+        arguments -- list of arguments for the method, but the data
+        data      -- a string or buffer (mmap...)
+        codec     -- the message codec
+
+        Returns:
+        a tuple of the payload length and an iterator over the parts
+        """
+        if getattr(codec, 'name', None) not in ('json', 'orjson', 'ujson'):
+            # buffers (mmap...) are encoded in place
+            payload = codec.encode(
+                [app, name] + list(arguments) + [b64encode(data)])
+            return len(payload), iter([payload])
+        message = [app, name] + list(arguments)
+        prefix = json.dumps(message)[:-1] + (', "' if message else '"')
+        suffix = '"]'
+        length = len(prefix) + (len(data) + 2) // 3 * 4 + len(suffix)
+
+        def parts():
+            yield prefix
+            # chunks are a multiple of 3 bytes long, so that base64 chunks
+            # can be concatenated
+            for offset in range(0, len(data), STREAM_CHUNK):
+                yield b64encode(data[offset:offset + STREAM_CHUNK])
+            yield suffix
+        return length, parts()
+
+    def upload(self, name, arguments, data):
+        """
+        Call a remote method whose last argument is binary data sent as
+        base64, without building the whole request in memory
+
+        Keyword arguments:
+        name      -- name of the remote method
+        arguments -- list of arguments for the method, but the data
+        data      -- a string or buffer (mmap...)
+        """
+        length, parts = self._stream(
+            self._app, name, arguments, data, self._codec)
+        with self._lock:
+            self.drain()
+            self.requests += 1
+            start = time.time()
+            self._transport.send_parts(length, parts)
+            if self.metrics is None:
+                return self._receive(self._transport, self._codec)
+            return self._measure(name, start, length)
+
+    def submit(self, name, arguments, window=None):
+        """
+        Send a request without waiting for the answer
+
+        Keyword arguments:
+        name      -- name of the remote method
+        arguments -- list of arguments for the method
+        window    -- maximum count of unanswered requests, answers are
+                     received first if the window is full
+
+        Returns:
+        a future holding the remote result once received
+        """
+        with self._lock:
+            while window is not None and len(self._pending) >= window:
+                self.receive()
+            if self.metrics is None:
+                self._send(self._transport, self._app, name, arguments,
+                           self._codec)
+                sent = None
+            else:
+                payload = self._encode(
+                    self._app, name, arguments, self._codec)
+                sent = (name, time.time(), len(payload))
+                self._transport.send(payload)
+            self.requests += 1
+            future = Future(self)
+            self._pending.append((future, sent))
+        return future
+
+    def receive(self):
+        """
+        Receive the answer to the oldest outstanding request
+        """
+        with self._lock:
+            future, sent = self._pending.popleft()
+            try:
+                if sent is None:
+                    result = self._receive(self._transport, self._codec)
+                else:
+                    result = self._measure(*sent)
+                future._set_result(result)
+            except RuntimeError as error:
+                future._set_error(error)
+
+    def wait(self, future):
+        """
+        Receive answers until the given future is resolved
+
+        Keyword arguments:
+        future -- a future returned by submit
+        """
+        with self._lock:
+            while not future.done():
+                self.receive()
+
+    def drain(self):
+        """
+        Receive the answers to every outstanding request
+        """
+        with self._lock:
+            while len(self._pending) > 0:
+                self.receive()
+
+    def map(self, name, arguments, window=None):
+        """
+        Call a remote method once per set of arguments, through a pipeline
+
+        Keyword arguments:
+        name      -- name of the remote method
+        arguments -- list of argument lists
+        window    -- maximum count of unanswered requests
+
+        Returns:
+        the list of remote results, in order
+
+        Exceptions:
+        RuntimeError -- one of the remote calls failed
+        """
+        with self.pipeline(window) as pipeline:
+            futures = [pipeline.call(name, args) for args in arguments]
+        return [future.result() for future in futures]
+
+    def pipeline(self, window=None):
+        """
+        Open a pipeline over the connection
+
+        Keyword arguments:
+        window -- maximum count of unanswered requests (default: WINDOW)
+
+        Returns:
+        a pipeline instance, usable as a context manager
+        """
+        return Pipeline(self, window)
+
+    def __getattr__(self, name):
+        """
+        Proxify every call to the remote end point using the _exchange
+        method
+        """
+        def proxy(*arguments):
+            """
+            Proxy function
+            """
+            with self._lock:
+                # answers to pipelined requests come first
+                self.drain()
+                self.requests += 1
+                return self._exchange(name, arguments)
+        # return the proxy
+        return proxy
+
+
+# size of the binary chunks of streamed requests, a multiple of 3
+STREAM_CHUNK = 3 * 64 * 1024
+
+
+class Pipeline(object):
+    """
+    Pipelined access to the remote end point
+
+    Requests are written back-to-back without waiting for the answers,
+    which are matched to their futures in FIFO order. The window limits
+    the count of unanswered requests so that neither side blocks on full
+    socket buffers.
+
+    Usage:
+
+        with protocol.pipeline() as pipeline:
+            futures = [pipeline.getTypes(index, []) for index in indices]
+        types = [future.result() for future in futures]
+    """
+
+    # default maximum count of unanswered requests
+    WINDOW = 128
+
+    def __init__(self, protocol, window=None):
+        """
+        Initialize the pipeline
+
+        Keyword arguments:
+        protocol -- the underlying protocol instance
+        window   -- maximum count of unanswered requests
+        """
+        self._protocol = protocol
+        self._window = self.WINDOW if window is None else window
+        assert self._window > 0, ValueError("Window must be positive")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.flush()
+
+    def call(self, name, arguments):
+        """
+        Send a request through the pipeline
+
+        Keyword arguments:
+        name      -- name of the remote method
+        arguments -- list of arguments for the method
+
+        Returns:
+        a future holding the remote result
+        """
+        return self._protocol.submit(name, arguments, self._window)
+
+    def flush(self):
+        """
+        Receive every outstanding answer
+        """
+        self._protocol.drain()
+
+    def __getattr__(self, name):
+        """
+        Proxify every call to the remote end point using the call method
+        """
+        def proxy(*arguments):
+            """
+            Proxy function
+            """
+            return self.call(name, arguments)
+        # return the proxy
+        return proxy
+
+
+class ProtocolPool(object):
+    """
+    Pool of protocol instances connected to the same remote application
+
+    Every remote call checks a connection out of the pool, so that calls
+    from several threads run in parallel instead of serializing on a
+    single socket. Connections are opened lazily, up to the pool size.
+
+    Entry points belong to the remote application, not to the connection,
+    so objects may be used through any connection of the pool.
+
+    A thread keeps the connection it checked out for nested calls and
+    pipelines, so that nesting never waits for a second connection.
+    Pipelines must thus be flushed by the thread that opened them.
+    """
+
+    def __init__(self, remote, app, size, codec=None, metrics=None):
+        """
+        Initialize the pool and open the first connection
+
+        Keyword arguments:
+        remote  -- address and port of the remote end point
+        app     -- inspected application package
+        size    -- maximum count of connections
+        codec   -- message codec name or instance (see Protocol)
+        metrics -- metrics shared by every connection (see Protocol)
+
+        Exceptions:
+        IOError -- connection to the remote end point failed
+        """
+        assert size > 0, ValueError("Pool size must be positive")
+        self._remote = remote
+        self._app = app
+        self._size = size
+        self._codec = codec
+        self._metrics = metrics
+        self._lock = threading.Lock()
+        self._protocols = []
+        # count of connections being opened, not listed yet
+        self._opening = 0
+        # connection checked out by the current thread, and nesting depth
+        self._local = threading.local()
+        self._idle = Queue()
+        self._idle.put(self._connect())
+
+    @property
+    def requests(self):
+        """
+        Count of requests sent so far through every connection
+        """
+        return sum(protocol.requests for protocol in self._protocols)
+
+    @property
+    def metrics(self):
+        """
+        Metrics shared by every connection, None if calls are not recorded
+        """
+        return self._metrics
+
+    @metrics.setter
+    def metrics(self, metrics):
+        with self._lock:
+            self._metrics = metrics
+            for protocol in self._protocols:
+                protocol.metrics = metrics
+
+    def _connect(self):
+        """
+        Open a new connection of the pool
+
+        The connection is opened without holding the pool lock, so that
+        other threads may check idle connections out meanwhile.
+        """
+        protocol = Protocol(
+            self._remote, self._app, self._codec, self._metrics)
+        with self._lock:
+            # metrics may have been replaced meanwhile
+            protocol.metrics = self._metrics
+            self._protocols.append(protocol)
+        return protocol
+
+    def _checkout(self):
+        """
+        Take an idle connection, or open a new one if the pool is not full
+
+        Blocks until a connection is released if the pool is full.
+        """
+        with self._lock:
+            reserved = self._idle.empty() and \
+                len(self._protocols) + self._opening < self._size
+            if reserved:
+                self._opening += 1
+        if not reserved:
+            return self._idle.get()
+        try:
+            return self._connect()
+        finally:
+            with self._lock:
+                self._opening -= 1
+
+    def acquire(self):
+        """
+        Check a connection out of the pool
+
+        A thread that already holds a connection gets it again. Otherwise
+        an idle connection is taken, or a new one is opened if the pool is
+        not full, or the call blocks until a connection is released.
+        """
+        local = self._local
+        if getattr(local, 'depth', 0) > 0:
+            local.depth += 1
+            return local.protocol
+        protocol = self._checkout()
+        local.protocol, local.depth = protocol, 1
+        return protocol
+
+    def release(self, protocol):
+        """
+        Give a connection back to the pool, once every nested use by the
+        current thread is over
+        """
+        local = self._local
+        if getattr(local, 'protocol', None) is protocol:
+            local.depth -= 1
+            if local.depth > 0:
+                return
+            local.protocol = None
+        self._idle.put(protocol)
+
+    def pipeline(self, window=None):
+        """
+        Open a pipeline over a connection checked out of the pool
+
+        The connection is released when the pipeline is flushed, hence the
+        pipeline must be used as a context manager.
+        """
+        return PoolPipeline(self, window)
+
+    def map(self, name, arguments, window=None):
+        """
+        Call a remote method once per set of arguments, spreading the calls
+        over the connections of the pool (see Protocol.map)
+        """
+        count = min(self._size, len(arguments))
+        if count < 2:
+            protocol = self.acquire()
+            try:
+                return protocol.map(name, arguments, window)
+            finally:
+                self.release(protocol)
+        results = [None] * count
+        errors = []
+
+        def worker(index):
+            protocol = self.acquire()
+            try:
+                results[index] = protocol.map(
+                    name, arguments[index::count], window)
+            except Exception as error:
+                errors.append(error)
+            finally:
+                self.release(protocol)
+
+        threads = [threading.Thread(target=worker, args=(index,))
+                   for index in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if len(errors) > 0:
+            raise errors[0]
+        # interleave the results back in order
+        merged = [None] * len(arguments)
+        for index in range(count):
+            merged[index::count] = results[index]
+        return merged
+
     def __getattr__(self, name):
         """
-        Proxify every call to the remote end point using the _call method
+        Proxify every call to a connection of the pool
         """
         def proxy(*arguments):
             """
             Proxy function
             """
-            return self._call(self._socket, self._app, name, arguments)
+            protocol = self.acquire()
+            try:
+                return getattr(protocol, name)(*arguments)
+            finally:
+                self.release(protocol)
         # return the proxy
         return proxy
 
 
+class PoolPipeline(Pipeline):
+    """
+    Pipeline over a connection checked out of a pool
+    """
+
+    def __init__(self, pool, window=None):
+        """
+        Initialize the pipeline
+
+        Keyword arguments:
+        pool   -- the protocol pool
+        window -- maximum count of unanswered requests
+        """
+        Pipeline.__init__(self, pool.acquire(), window)
+        self._pool = pool
+
+    def flush(self):
+        """
+        Receive every outstanding answer and release the connection
+        """
+        Pipeline.flush(self)
+        if self._pool is not None:
+            self._pool.release(self._protocol)
+            self._pool = None
+
+
+class Batch(object):
+    """
+    Batch of remote calls
+
+    Calls performed by the service while a batch is active are queued
+    locally and return futures (placeholders) instead of results. Queued
+    calls are sent when the batch commits, through a single pipeline per
+    dependency level: a call whose arguments depend on the result of a
+    previous call of the batch is sent once that result is known.
+
+    Pure pushes of primitive values may be sent ahead of the other calls,
+    which otherwise keep their order. Asking for the result of a
+    placeholder commits every queued call.
+
+    Usage:
+
+        with app.batch():
+            for name, value in patch.items():
+                setattr(state, name, value)
+    """
+
+    # remote calls that may be sent ahead of previous calls
+    PURE = ('pushString', 'pushInt', 'pushBool', 'pushLong', 'pushDouble',
+            'pushBytes', 'pushArray')
+
+    def __init__(self, service, window=None):
+        """
+        Initialize the batch
+
+        Keyword arguments:
+        service -- the service the batch applies to
+        window  -- maximum count of unanswered requests when committing
+        """
+        self._service = service
+        self._window = window
+        self._queue = []
+        self._depth = 0
+
+    def __enter__(self):
+        if self._depth == 0:
+            self._service._batch = self
+        self._depth += 1
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._depth -= 1
+        if self._depth > 0:
+            return
+        self._service._batch = None
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+
+    def call(self, name, arguments):
+        """
+        Queue a remote call
+
+        Keyword arguments:
+        name      -- name of the remote method
+        arguments -- list of arguments for the method, possibly futures
+
+        Returns:
+        a future holding the remote result
+        """
+        future = Future(self)
+        self._queue.append((name, list(arguments), future))
+        return future
+
+    def wait(self, future):
+        """
+        Commit the batch so that the given future gets resolved
+        """
+        self.commit()
+        if not future.done():
+            raise RuntimeError("Future does not belong to the batch")
+
+    @staticmethod
+    def _dependencies(argument):
+        """
+        List futures a call argument depends on
+        """
+        if isinstance(argument, Future):
+            return [argument._source()]
+        elif isinstance(argument, list):
+            return sum(map(Batch._dependencies, argument), [])
+        return []
+
+    @staticmethod
+    def _argument(argument):
+        """
+        Replace futures with their results in a call argument
+        """
+        if isinstance(argument, Future):
+            return resolved(argument)
+        elif isinstance(argument, list):
+            return map(Batch._argument, argument)
+        return argument
+
+    def _levels(self, queue):
+        """
+        Split queued calls into dependency levels
+        """
+        levels = {}
+        barrier = 0
+        result = []
+        for name, arguments, future in queue:
+            level = max([levels[dependency] + 1
+                         for dependency in self._dependencies(arguments)
+                         if dependency in levels] + [0])
+            # only pure calls may be sent ahead of previous calls
+            if name not in self.PURE:
+                level = max(level, barrier)
+                barrier = level
+            levels[future] = level
+            while len(result) <= level:
+                result.append([])
+            result[level].append((name, arguments, future))
+        return result
+
+    def _failure(self, arguments):
+        """
+        Get the error of a failed call some call arguments depend on
+
+        Returns:
+        the error, or None if no dependency failed
+        """
+        for dependency in self._dependencies(arguments):
+            if dependency.done() and dependency._error is not None:
+                return dependency._error
+        return None
+
+    def commit(self):
+        """
+        Send every queued call and resolve the matching futures
+
+        Calls depending on the result of a failed call fail with the same
+        error, without being sent. Other calls are sent anyway.
+        """
+        queue, self._queue = self._queue, []
+        for level in self._levels(queue):
+            sent = []
+            with self._service.protocol.pipeline(self._window) as pipeline:
+                for name, arguments, future in level:
+                    error = self._failure(arguments)
+                    if error is None:
+                        try:
+                            arguments = self._argument(arguments)
+                        except RuntimeError as failure:
+                            error = failure
+                    if error is not None:
+                        future._set_error(error)
+                        continue
+                    sent.append((pipeline.call(name, arguments), future))
+            for answer, future in sent:
+                try:
+                    future._set_result(answer.result())
+                except RuntimeError as error:
+                    future._set_error(error)
+
+    def abort(self):
+        """
+        Drop every queued call
+        """
+        queue, self._queue = self._queue, []
+        for _, _, future in queue:
+            future._set_error(RuntimeError("Batch aborted"))
+
+
 def list_applications(remote):
     """
     List applications that may be inspected on the given remote end point
@@ -117,66 +842,370 @@ def list_applications(remote):
     """
     sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     sock.connect(remote)
-    result = Protocol._call(sock, '', 'listApps', [])
-    sock.close()
+    transport = Transport(sock)
+    result = Protocol._call(transport, '', 'listApps', [])
+    transport.close()
     return result
 
 
-class Service(object):
-    """
-    Wrapping service over the protocol
+# remote types whose mapped classes hold a value (see gadget.types)
+VALUE_TYPES = ('java.lang.Integer', 'java.lang.Boolean', 'java.lang.String')
+
+# remote types of primitive fields, which are never null
+PRIMITIVES = {
+    'boolean': 'java.lang.Boolean',
+    'byte': 'java.lang.Byte',
+    'char': 'java.lang.Character',
+    'short': 'java.lang.Short',
+    'int': 'java.lang.Integer',
+    'long': 'java.lang.Long',
+    'float': 'java.lang.Float',
+    'double': 'java.lang.Double',
+}
+
+
+class Service(object):
+    """
+    Wrapping service over the protocol
+
+    The service provides access to remote functions through more semantic
+    wrappers with use of the type mapping module and classes.
+
+    While a batch is active (see the batch method), remote calls are queued
+    and service methods return futures instead of actual results. Batches
+    are local to the thread that opened them.
+
+    Remote values are cached according to a freshness policy (see
+    gadget.cache.ValueCache), values are always fetched by default.
+
+    Entry points allocated by the client are released once no mapped
+    object references them anymore (see gadget.lifecycle).
+
+    If the remote end point accepts inline values as call arguments, in
+    the form {"type": "int", "value": 1}, the inline attribute may be set
+    so that Python values are not pushed before calls.
+    """
+
+    # remote push methods for Python types
+    PUSHES = {str: 'pushString', int: 'pushInt', long: 'pushLong',
+              float: 'pushDouble', bool: 'pushBool'}
+
+    # remote types of Python values inlined in calls
+    INLINE = {str: 'java.lang.String', int: 'int', long: 'long',
+              float: 'double', bool: 'boolean'}
+
+    # remote methods allocating a new entry point
+    ALLOCATING = ('push', 'pushString', 'pushInt', 'pushLong', 'pushDouble',
+                  'pushBool', 'pushBytes', 'pushArray', 'getClass',
+                  'newInstance', 'invokeMethodByName', 'invokeMethod',
+                  'loadMacro')
+
+    def __init__(self, protocol, freshness=ALWAYS, ttl=None, inline=False):
+        """
+        Initialize the service
+
+        Keyword arguments:
+        protocol  -- a protocol or protocol pool instance
+        freshness -- the value freshness policy
+        ttl       -- value lifetime in seconds, for the TTL policy
+        inline    -- inline Python values in call arguments
+        """
+        self.protocol = protocol
+        self.inline = inline
+        self.entry_points = None
+        self._entry_point_count = 0
+        # entry points by class name, then by entry point number
+        self._classes = {}
+        # serializes entry point refreshes among threads
+        self._entry_point_lock = threading.RLock()
+        self.metadata = MetadataCache()
+        self.values = ValueCache(freshness, ttl)
+        self.lifecycle = EntryPointTracker()
+        # loaded macros, by content digest and class name
+        self.macros = {}
+        # interned type tuples, by concrete class name, in front of the
+        # metadata cache so that wrapping never reaches the store
+        self._types = {}
+        self._local = threading.local()
+
+    def _get_batch(self):
+        return getattr(self._local, 'batch', None)
+
+    def _set_batch(self, batch):
+        self._local.batch = batch
+
+    _batch = property(_get_batch, _set_batch)
+
+    def _request(self, name, *arguments):
+        """
+        Perform a remote call, or queue it if a batch is active
+
+        Returns:
+        the remote result, or a future if the call was queued
+        """
+        if self._batch is not None:
+            result = self._batch.call(name, arguments)
+        else:
+            result = getattr(self.protocol, name)(*arguments)
+            self.release_entry_points(force=False)
+        if name in self.ALLOCATING:
+            self.lifecycle.own(result)
+        return result
+
+    def _fetch(self, name, *arguments):
+        """
+        Perform a remote call right away
+
+        Calls queued by an active batch are committed first so that the
+        call order is preserved.
+        """
+        if self._batch is not None:
+            self._batch.commit()
+        result = getattr(self.protocol, name)(*arguments)
+        self.release_entry_points(force=False)
+        if name in self.ALLOCATING:
+            self.lifecycle.own(result)
+        return result
+
+    def release_entry_points(self, force=True):
+        """
+        Release unreferenced entry points allocated by the client
+
+        Nothing is released while a batch is active. If the remote end
+        point does not support releasing, entry points are not tracked
+        anymore.
+
+        Keyword arguments:
+        force -- release even if only a few entry points are unreferenced
+        """
+        if self._batch is not None:
+            return
+        entry_points = self.lifecycle.collect(force)
+        if not entry_points:
+            return
+        try:
+            self.protocol.releaseEntryPoints(entry_points)
+        except RuntimeError:
+            self.lifecycle.disable()
+            return
+        for entry_point in entry_points:
+            self.values.invalidate(entry_point)
+
+    @contextmanager
+    def holding(self):
+        """
+        Prepare and perform a call without releasing any entry point
+
+        Entry points of pushed arguments and of the receiver are kept until
+        the call is performed, unreferenced entry points are released once
+        the context ends.
+        """
+        with self.lifecycle.hold():
+            yield self
+        self.release_entry_points(force=False)
+
+    def batch(self, window=None):
+        """
+        Open a batch of remote calls
+
+        If a batch is already active, it is simply reused.
+
+        Keyword arguments:
+        window -- maximum count of unanswered requests when committing
+
+        Returns:
+        a batch instance, to be used as a context manager
+        """
+        if self._batch is not None:
+            return self._batch
+        return Batch(self, window)
+
+    def get_entry_points(self, force=False):
+        """
+        List entry points as objects
+
+        Entry points added on the remote side since the last call are
+        wrapped, existing wrappers are kept.
+
+        Keyword arguments:
+        force -- enumerate and refresh every entry point again
+
+        Returns:
+        a list of entry point objects
+        """
+        with self._entry_point_lock:
+            self.refresh_entry_points(full=force)
+            entry_points = self.entry_points
+        if force:
+            for entry_point in entry_points:
+                entry_point._refresh()
+        return entry_points
+
+    def refresh_entry_points(self, full=False):
+        """
+        Refresh the service entry point cache
+
+        Only entry points added since the last refresh are fetched, unless
+        a full refresh is requested or the remote list shrank. Types of
+        every new entry point are fetched through pipelines, spread over
+        the connections of the pool if any.
+
+        Refreshes are serialized among threads.
+
+        Keyword arguments:
+        full -- enumerate every entry point again
+        """
+        with self._entry_point_lock:
+            count = len(self._fetch('getEntryPoints'))
+            known = self.entry_points
+            if full or known is None or count < self._entry_point_count:
+                known = []
+                self._entry_point_count = 0
+                self._classes = {}
+            # entry points allocated by the client are not listed
+            start = self._entry_point_count
+            indices = [index for index in range(start, count)
+                       if not self.lifecycle.owned(index)]
+            types = self.protocol.map(
+                'getTypes', [(index, []) for index in indices])
+            added = [self._wrap(types[offset], index, [])
+                     for offset, index in enumerate(indices)]
+            # released entry points have no type
+            added = [entry_point for entry_point in added
+                     if entry_point is not None]
+            # index entry points by class name, including super classes
+            for entry_point in added:
+                for classname in entry_point._types:
+                    self._classes.setdefault(classname, {})[
+                        entry_point._entry_point] = entry_point
+            self.entry_points = known + added
+            self._entry_point_count = count
+
+    def find_entry_points(self, classname):
+        """
+        Find entry points that are instances of a given class
+
+        Keyword arguments:
+        classname -- the class name
+
+        Returns:
+        a list of entry point objects
+        """
+        with self._entry_point_lock:
+            self.refresh_entry_points()
+            found = self._classes.get(classname, {})
+            return [found[entry_point] for entry_point in sorted(found)]
+
+    def pipeline(self, window=None):
+        """
+        Open a pipeline over the service protocol
+
+        Calls queued by an active batch are committed first.
 
-    The service provides access to remote functions through more semantic
-    wrappers with use of the type mapping module and classes.
-    """
+        Keyword arguments:
+        window -- maximum count of unanswered requests
 
-    def __init__(self, protocol):
+        Returns:
+        a pipeline instance, usable as a context manager
         """
-        Initialize the service
+        if self._batch is not None:
+            self._batch.commit()
+        return self.protocol.pipeline(window)
 
-        Keyword arguments:
-        protocol -- a protocol instance
+    def _wrap(self, types, entry_point, path):
         """
-        self.protocol = protocol
-        self.entry_points = None
+        Wrap a remote object into its mapped class instance
 
+        Keyword arguments:
+        types       -- list of remote types of the object
+        entry_point -- the object entry point
+        path        -- path from the entry point to the object
+        """
+        if len(types) == 0:
+            return None
+        types = self._intern(types)
+        obj = Registry.resolve(types)(self, types, entry_point, path)
+        self.lifecycle.track(obj)
+        return obj
 
-    def get_entry_points(self, force=False):
+    def _intern(self, types):
         """
-        List entry points as objects
+        Keep track of the type hierarchy of every class met, objects of the
+        same class share a single type tuple
 
-        Returns:
-        a list of entry point objects
+        Only the hierarchies of cacheable classes are stored in the
+        metadata cache.
         """
-        # refresh the entry point cache if necessary
-        if (self.entry_points is None) or force:
-            self.refresh_entry_points()
-        # refresh entry points
-        for entry_point in self.entry_points:
-            entry_point._refresh()
-        return self.entry_points
+        classname = types[0]
+        interned = self._types.get(classname)
+        if interned is None:
+            if self.metadata.cacheable(classname):
+                interned = self.metadata.get('types', classname) or \
+                    self.metadata.set('types', classname, tuple(types))
+            else:
+                interned = tuple(types)
+            interned = self._types.setdefault(classname, interned)
+        return interned
+
+    def _cached_types(self, classname):
+        """
+        Get the type hierarchy of a class, if met before or persisted
 
-    def refresh_entry_points(self):
+        Returns:
+        the interned type tuple, or None
         """
-        Refresh the service entry point cache
+        interned = self._types.get(classname)
+        if interned is None:
+            interned = self.metadata.get('types', classname)
+            if interned is not None:
+                interned = self._types.setdefault(classname, interned)
+        return interned
+
+    def _get_table(self, kind, name, parse, entry_point, path, classname):
         """
-        self.entry_points = [
-            self.get_field(index, [])
-            for index in range(len(self.protocol.getEntryPoints()))]
+        Fetch and parse a metadata table, using the per class cache
 
-    def get_fields(self, entry_point, path):
+        Keyword arguments:
+        kind        -- the table kind in the metadata cache
+        name        -- name of the remote listing method
+        parse       -- the listing parser
+        entry_point -- the object entry point
+        path        -- path from the entry point to the object
+        classname   -- the object concrete class name, if known
+        """
+        if not self.metadata.cacheable(classname):
+            return then(self._request(name, entry_point, path), parse)
+        table = self.metadata.get(kind, classname)
+        if table is not None:
+            return table
+        return then(self._request(name, entry_point, path),
+                    lambda listing: self.metadata.set(
+                        kind, classname, parse(listing)))
+
+    def get_fields(self, entry_point, path, classname=None):
         """
         List fields of a specific object
 
+        If the concrete class name of the object is given, the listing is
+        shared with every other object of the same class.
+
         Keyword arguments:
         entry_point -- the object entry point
         path        -- path from the entry point to the object
+        classname   -- the object concrete class name
 
         Returns:
         a dictionary with field names as keys and tuples of both modifiers
         and field identifier as value
         """
-        fields = self.protocol.getFields(entry_point, path)
+        return self._get_table('fields', 'getFields', self._parse_fields,
+                               entry_point, path, classname)
+
+    @staticmethod
+    def _parse_fields(fields):
+        """
+        Parse a remote field listing
+        """
         result = {}
         for index, field in enumerate(fields):
             name, signature = field.split(':')
@@ -187,23 +1216,253 @@ class Service(object):
             result[name] = (modifiers, type_, index)
         return result
 
-    def get_field(self, entry_point, path):
+    def get_field(self, entry_point, path, declared=None):
         """
         Get a specific field wrapped into an mapped class instance
 
+        If the field is declared with a primitive type whose hierarchy is
+        already known, the remote types are not requested. If it is declared
+        with a value type, which are final classes, its value is fetched
+        along with its types through a pipeline, in a single round trip.
+
         Keyword arguments:
         entry_point -- the object entry point
         path        -- path from the entry point to the object
+        declared    -- the declared type of the field, if known
 
         Returns:
         a mapped class instance for the object
         """
+        if isinstance(entry_point, Future):
+            return entry_point.then(
+                lambda entry_point: self.get_field(entry_point, path))
         if entry_point < 0:
             return None
-        types = self.protocol.getTypes(entry_point, path)
-        if len(types) == 0:
+        if declared in PRIMITIVES:
+            types = self._cached_types(PRIMITIVES[declared])
+            if types is not None:
+                return self._wrap(types, entry_point, path)
+        if declared in VALUE_TYPES and self._batch is None:
+            with self.pipeline() as pipeline:
+                types = pipeline.getTypes(entry_point, path)
+                value = pipeline.getValue(entry_point, path)
+            types = types.result()
+            # null fields have no value
+            if not types:
+                return None
+            # the wrapper reads its value from the cache
+            with self.values.snapshot():
+                self.values.set(entry_point, path, value.result())
+                return self._wrap(types, entry_point, path)
+        return then(self._request('getTypes', entry_point, path),
+                    lambda types: self._wrap(types, entry_point, path))
+
+    def get_elements(self, entry_point, path, indices):
+        """
+        Get several elements of a remote array (see get_objects)
+
+        Keyword arguments:
+        entry_point -- the array entry point
+        path        -- path from the entry point to the array
+        indices     -- indices of the elements
+
+        Returns:
+        a list of mapped class instances, None for null elements
+        """
+        return self.get_objects(
+            [(entry_point, path + [index]) for index in indices])
+
+    def get_objects(self, addresses):
+        """
+        Get several objects at once
+
+        Types of the objects, then values of value typed objects, are
+        fetched through pipelines instead of one call per object. Calls
+        queued by an active batch are committed first.
+
+        Keyword arguments:
+        addresses -- list of (entry point, path) tuples
+
+        Returns:
+        a list of mapped class instances, None for null objects
+        """
+        if self._batch is not None:
+            self._batch.commit()
+        types = self.protocol.map('getTypes', addresses)
+        valued = [address for address, types_ in zip(addresses, types)
+                  if types_ and types_[0] in VALUE_TYPES]
+        values = self.protocol.map('getValue', valued)
+        # wrappers read their value from the cache
+        with self.values.snapshot():
+            for (entry_point, path), value in zip(valued, values):
+                self.values.set(entry_point, path, value)
+            return [self._wrap(types_, entry_point, path)
+                    for types_, (entry_point, path) in zip(types, addresses)]
+
+    def get_field_tables(self, objects):
+        """
+        List fields of several objects at once
+
+        Listings missing from the metadata cache are fetched through a
+        single pipeline.
+
+        Keyword arguments:
+        objects -- list of mapped objects
+
+        Returns:
+        the list of field tables (see get_fields)
+        """
+        # listings are shared per class, unless the class is uncacheable
+        keys = [obj._types[0] if self.metadata.cacheable(obj._types[0])
+                else id(obj) for obj in objects]
+        tables = {}
+        missing = {}
+        for key, obj in zip(keys, objects):
+            if isinstance(key, basestring):
+                tables[key] = self.metadata.get('fields', key)
+            if tables.get(key) is None:
+                missing[key] = obj
+        if missing:
+            listings = self.protocol.map(
+                'getFields', [(obj._entry_point, obj._path)
+                              for obj in missing.values()])
+            for key, listing in zip(missing.keys(), listings):
+                tables[key] = self._parse_fields(listing)
+                if isinstance(key, basestring):
+                    tables[key] = self.metadata.set('fields', key, tables[key])
+        return [tables[key] for key in keys]
+
+    def push_objects(self, objects):
+        """
+        Give entry points to several objects at once
+
+        Objects that are not entry points yet are pushed through a single
+        pipeline (see Object._getentrypoint).
+
+        Keyword arguments:
+        objects -- list of mapped objects
+        """
+        objects = [obj for obj in objects if len(obj._path) > 0]
+        entry_points = self.protocol.map(
+            'push', [(obj._entry_point, obj._path) for obj in objects])
+        for obj, entry_point in zip(objects, entry_points):
+            self.lifecycle.own(entry_point)
+            obj._entry_point, obj._path = entry_point, []
+            self.lifecycle.track(obj)
+
+    def resolve(self, root, names):
+        """
+        Get an object given a chain of field names from a root object
+
+        Field indices along the chain are compiled into a single path the
+        first time, and cached per root class along with the class met at
+        every hop. Later resolutions fetch the types of every hop through a
+        single pipeline, and check each of them against the compiled
+        classes: if an intermediate object is of another class, or null,
+        the chain is walked and compiled again.
+
+        Keyword arguments:
+        root  -- the root mapped object
+        names -- list of field names
+
+        Returns:
+        a mapped class instance, or None if a field on the way is null
+
+        Exceptions:
+        AttributeError -- unknown field
+        """
+        entry_point, classname = root._entry_point, root._types[0]
+        key = tuple(names)
+        compiled = None
+        if self.metadata.cacheable(classname):
+            compiled = self.metadata.get('paths', classname)
+            if compiled is None:
+                compiled = self.metadata.set('paths', classname, {})
+            if key in compiled:
+                indices, classes = compiled[key]
+                types = self._hop_types(entry_point, root._path, indices)
+                if types is not None and [
+                        found[0] if found else None
+                        for found in types] == list(classes):
+                    return self._wrap(
+                        types[-1], entry_point, root._path + indices)
+        # walk the chain one field at a time
+        path, types, classes = root._path, root._types, []
+        for name in names:
+            fields = resolved(self.get_fields(entry_point, path, types[0]))
+            if name not in fields:
+                raise AttributeError("Unknown field %s" % name)
+            path = path + [fields[name][2]]
+            types = self._fetch('getTypes', entry_point, path)
+            if not types:
+                return None
+            classes.append(types[0])
+        if compiled is not None:
+            compiled[key] = (path[len(root._path):], tuple(classes))
+        return self._wrap(types, entry_point, path)
+
+    def _hop_types(self, entry_point, path, indices):
+        """
+        Get the types of every object along a compiled path, through a
+        single pipeline
+
+        Returns:
+        the list of type lists, one per hop, or None if a hop failed
+        """
+        with self.pipeline() as pipeline:
+            futures = [pipeline.getTypes(entry_point, path + indices[:hop])
+                       for hop in range(1, len(indices) + 1)]
+        try:
+            return [future.result() for future in futures]
+        except RuntimeError:
             return None
-        return Registry.resolve(types)(self, types, entry_point, path)
+
+    def get_attributes(self, entry_point, path, classname=None):
+        """
+        Index the attributes of a specific object
+
+        Missing field and method listings are requested through a single
+        pipeline. The index is shared among objects of the same class.
+
+        Keyword arguments:
+        entry_point -- the object entry point
+        path        -- path from the entry point to the object
+        classname   -- the object concrete class name
+
+        Returns:
+        a dictionary with attribute names as keys and tuples of kind
+        (FIELD, METHOD or AMBIGUOUS) and field index as values
+        """
+        cacheable = self.metadata.cacheable(classname)
+        if cacheable:
+            attributes = self.metadata.get('attributes', classname)
+            if attributes is not None:
+                return attributes
+            fields = self.metadata.get('fields', classname)
+            methods = self.metadata.get('methods', classname)
+        else:
+            fields = methods = None
+        if fields is None or methods is None:
+            with self.pipeline() as pipeline:
+                if fields is None:
+                    fields = pipeline.getFields(entry_point, path)
+                if methods is None:
+                    methods = pipeline.getMethods(entry_point, path)
+            if isinstance(fields, Future):
+                fields = self._parse_fields(fields.result())
+                if cacheable:
+                    fields = self.metadata.set('fields', classname, fields)
+            if isinstance(methods, Future):
+                methods = self._parse_methods(methods.result())
+                if cacheable:
+                    methods = self.metadata.set('methods', classname, methods)
+        attributes = dict((name, (METHOD, None)) for name in methods)
+        for name, (_, _, index) in fields.items():
+            attributes[name] = (
+                AMBIGUOUS if name in attributes else FIELD, index)
+        if cacheable:
+            attributes = self.metadata.set('attributes', classname, attributes)
+        return attributes
 
     def get_class(self, classname):
         """
@@ -215,41 +1474,64 @@ class Service(object):
         Returns:
         a mapped class instance for the class
         """
-        clazz = self.protocol.getClass(classname)
-        types = self.protocol.getTypes(clazz, [])
-        if len(types) == 0:
-            return None
-        return Registry.resolve(types)(self, types, clazz, [])
+        clazz = self._fetch('getClass', classname)
+        return self._wrap(self._fetch('getTypes', clazz, []), clazz, [])
 
     def get_value(self, entry_point, path):
         """
         Get the remote value of a specific field
 
-        Mostly useful for primitive types.
+        Mostly useful for primitive types. The value may be served from the
+        value cache, depending on the freshness policy.
 
         Keyword arguments:
         entry_point -- the object entry point
         path        -- path from the entry point to the object
         """
-        return self.protocol.getValue(entry_point, path)
-
+        cached, value = self.values.get(entry_point, path)
+        if cached:
+            return value
+        return then(self._request('getValue', entry_point, path),
+                    lambda value: self.values.set(entry_point, path, value))
 
     def set_value(self, entry_point, path, value):
-        return self.protocol.setValue(entry_point, path, value)
+        """
+        Set the remote value of a specific field
+
+        Keyword arguments:
+        entry_point -- the object entry point
+        path        -- path from the entry point to the field
+        value       -- entry point or inline value of the new value
+        """
+        self.values.invalidate(entry_point, path)
+        result = self._request('setValue', entry_point, path, value)
+        self.lifecycle.discard([value])
+        return result
 
-    def get_methods(self, entry_point, path):
+    def get_method_table(self, entry_point, path, classname=None):
         """
-        List methods of a specific object
+        List method signatures of a specific object
+
+        If the concrete class name of the object is given, the listing is
+        shared with every other object of the same class.
 
         Keyword arguments:
         entry_point -- the object entry point
         path        -- path from the entry point to the object
+        classname   -- the object concrete class name
 
         Returns:
-        a dictionary with method names as keys and a list of tuples
-        of both modifiers and concrete method object as value
+        a dictionary with method names as keys and a list of tuples of
+        modifiers, type, method identifier and signature as value
+        """
+        return self._get_table('methods', 'getMethods', self._parse_methods,
+                               entry_point, path, classname)
+
+    @staticmethod
+    def _parse_methods(methods):
+        """
+        Parse a remote method listing
         """
-        methods = self.protocol.getMethods(entry_point, path)
         result = {}
         for index, method in enumerate(methods):
             name, signature = method.split(':')
@@ -259,11 +1541,157 @@ class Service(object):
             # populate the result
             if not name in result:
                 result[name] = []
-            result[name].append(
-                (modifiers, type_,
-                 Method(self, entry_point, path, index, signature)))
+            result[name].append((modifiers, type_, index, signature))
         return result
 
+    def get_methods(self, entry_point, path, classname=None):
+        """
+        List methods of a specific object
+
+        Keyword arguments:
+        entry_point -- the object entry point
+        path        -- path from the entry point to the object
+        classname   -- the object concrete class name
+
+        Returns:
+        a dictionary with method names as keys and a list of tuples
+        of both modifiers and concrete method object as value
+        """
+        def bind(table):
+            return dict(
+                (name, [(modifiers, type_,
+                         Method(self, entry_point, path, index, signature))
+                        for modifiers, type_, index, signature in methods])
+                for name, methods in table.items())
+        return then(self.get_method_table(entry_point, path, classname), bind)
+
+    def _argument_type(self, var):
+        """
+        Get the remote types of a method argument, as would be pushed
+
+        Returns:
+        a tuple of type names, ('null',) for null, or None if unknown
+        """
+        if isinstance(var, Object):
+            return var._types or ('null',)
+        elif var is None:
+            return ('null',)
+        elif type(var) is str:
+            return self._known_types('java.lang.String')
+        elif type(var) is bool:
+            return ('boolean',) + self._known_types('java.lang.Boolean')
+        call = self._push_call(var)
+        if call is None:
+            return None
+        primitive = {'pushInt': 'int', 'pushLong': 'long',
+                     'pushDouble': 'double'}[call[0]]
+        return (primitive,) + self._known_types(PRIMITIVES[primitive])
+
+    def _known_types(self, classname):
+        """
+        Get the type hierarchy of a class, if met before
+        """
+        return self._cached_types(classname) or \
+            (classname, 'java.lang.Object')
+
+    @staticmethod
+    def _parameters(type_):
+        """
+        Parse the parameter types of a method listing entry
+
+        Returns:
+        a list of type names, or None if the entry cannot be parsed
+        """
+        if not type_.endswith(')') or '(' not in type_:
+            return None
+        parameters = type_[type_.index('(') + 1:-1]
+        return [parameter.strip()
+                for parameter in parameters.split(',') if parameter.strip()]
+
+    @staticmethod
+    def _accepts(parameter, types):
+        """
+        Check whether an argument may be passed for a parameter
+        """
+        if types == ('null',):
+            return parameter not in PRIMITIVES
+        return parameter in types or PRIMITIVES.get(parameter) == types[0]
+
+    def _select(self, methods, types):
+        """
+        Select the single overload accepting arguments of the given types
+
+        Returns:
+        the method identifier, or None if no or several overloads match
+        """
+        matches = []
+        for _, type_, index, _ in methods:
+            parameters = self._parameters(type_)
+            if parameters is not None and len(parameters) == len(types) \
+                    and all(self._accepts(parameter, types_)
+                            for parameter, types_ in zip(parameters, types)):
+                matches.append((parameters, index))
+        if len(matches) > 1:
+            # prefer the overload matching the argument types exactly
+            matches = [(parameters, index) for parameters, index in matches
+                       if all(parameter == types_[0]
+                              for parameter, types_ in zip(parameters, types))]
+        if len(matches) == 1:
+            return matches[0][1]
+        return None
+
+    def get_overload(self, entry_point, path, classname, name, args):
+        """
+        Resolve a method call to a concrete method
+
+        Overloads are resolved locally from the method listing, once per
+        class, method name and argument types.
+
+        Keyword arguments:
+        entry_point -- the object entry point
+        path        -- path from the entry point to the object
+        classname   -- the object concrete class name
+        name        -- the method name
+        args        -- the Python arguments of the call
+
+        Returns:
+        the method identifier, or None if the call must be resolved on the
+        remote side (unknown argument types, ambiguous overloads)
+        """
+        if not self.metadata.cacheable(classname):
+            return None
+        types = tuple(self._argument_type(arg) for arg in args)
+        if None in types:
+            return None
+        overloads = self.metadata.get('overloads', classname)
+        if overloads is None:
+            overloads = self.metadata.set('overloads', classname, {})
+        key = (name,) + types
+        if key not in overloads:
+            table = self.metadata.get('methods', classname)
+            if table is None:
+                # listing the methods would require committing the batch
+                if self._batch is not None:
+                    return None
+                table = self.get_method_table(entry_point, path, classname)
+            overloads[key] = self._select(table.get(name, ()), types)
+        return overloads[key]
+
+    def invoke(self, entry_point, path, method, arguments):
+        """
+        Perform a concrete method call
+
+        Keyword arguments:
+        entry_point -- the object entry point
+        path        -- path from the entry point to the object
+        method      -- method identifier, from the method listing
+        arguments   -- list of arguments entry points
+        """
+        result = self._request('invokeMethod',
+                               entry_point, path, method, arguments)
+        self.lifecycle.discard(arguments)
+        return self.get_field(result, [])
+
     def new_instance(self, entry_point, path, args):
         """
         Perform a class instanciation
@@ -273,10 +1701,9 @@ class Service(object):
         path        -- path from the entry point to the object
         args        -- constructor args
         """
-        return self.get_field(
-            self.protocol.newInstance(
-                entry_point, path, args),
-            [])
+        instance = self._request('newInstance', entry_point, path, args)
+        self.lifecycle.discard(args)
+        return self.get_field(instance, [])
 
     def virtual(self, entry_point, path, method, arguments):
         """
@@ -291,10 +1718,10 @@ class Service(object):
         method      -- method name
         arguments   -- list of arguments entry points
         """
-        return self.get_field(
-            self.protocol.invokeMethodByName(
-                entry_point, path, method, arguments),
-            [])
+        result = self._request('invokeMethodByName',
+                               entry_point, path, method, arguments)
+        self.lifecycle.discard(arguments)
+        return self.get_field(result, [])
 
     def push(self, entry_point, path):
         """
@@ -307,21 +1734,174 @@ class Service(object):
         Returns:
         the new entry point for the object
         """
-        return self.protocol.push(entry_point, path)
+        return self._request('push', entry_point, path)
 
     def load_macro(self, classname, dex):
         """
         Load a dex file into the remote app
 
+        Loaded classes are cached for the session by content digest and
+        class name, so that loading the same macro again does not upload
+        it again. Otherwise, loaded classes may alter the remote class
+        hierarchy, so the class metadata cache is dropped. The metadata of
+        the loaded class is never persisted, as a macro may be built again
+        with another layout.
+
+        Keyword arguments:
+        classname -- the class name to retrieve
+        dex       -- the dex content to load, a string or buffer (mmap...)
+
+        Returns:
+        the mapped loaded object (macro)
+        """
+        digest = hashlib.sha256()
+        for offset in range(0, len(dex), STREAM_CHUNK):
+            digest.update(dex[offset:offset + STREAM_CHUNK])
+        key = (digest.hexdigest(), classname)
+        macro = self.macros.get(key)
+        if macro is not None:
+            return macro
+        if self._batch is not None:
+            self._batch.commit()
+        # the content is streamed rather than encoded as a whole
+        entry_point = self.protocol.upload('loadMacro', [classname], dex)
+        self.release_entry_points(force=False)
+        self.lifecycle.own(entry_point)
+        # the macro may be built again with another layout
+        self.metadata.exclude(classname)
+        self.metadata.invalidate()
+        macro = self.get_field(entry_point, [])
+        return self.macros.setdefault(key, macro)
+
+    def load_macro_file(self, classname, path):
+        """
+        Load a dex or APK file into the remote app (see load_macro)
+
+        The file is memory mapped, so that it is never read as a whole.
+
+        Keyword arguments:
+        classname -- the class name to retrieve
+        path      -- path of the file to load
+        """
+        with open(path, 'rb') as apk:
+            if not os.fstat(apk.fileno()).st_size:
+                # empty files cannot be mapped
+                return self.load_macro(classname, '')
+            content = mmap.mmap(apk.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            return self.load_macro(classname, content)
+        finally:
+            content.close()
+
+    def to_entry_point(self, var):
+        """
+        Take a Python typed object and push it as a remote entry point
+
+        Unlike to_object, the pushed value is not wrapped, which saves
+        round trips when the value is only used as an argument. Mapped
+        objects and futures are accepted as well.
+
+        Strings, integers (int or long depending on their value), floats
+        (as doubles) and booleans are pushed as boxed values, byte buffers
+        as byte arrays, and sequences as arrays (see push_array).
+
+        Keyword arguments:
+        var -- a Python typed object
+
+        Returns:
+        the new entry point, or None if the object cannot be pushed
+        """
+        if isinstance(var, Object):
+            return var._getentrypoint()
+        elif isinstance(var, Future):
+            return var.then(self.to_entry_point)
+        elif arrays.is_bytes(var):
+            return self._request('pushBytes', b64encode(bytes(bytearray(var))))
+        elif arrays.is_array(var):
+            return self.push_array(var)
+        call = self._push_call(var)
+        if call is None:
+            return None
+        name, arguments = call
+        return self._request(name, *arguments)
+
+    def _push_call(self, var):
+        """
+        Get the remote push call for a Python scalar value
+
+        Returns:
+        a tuple of the remote method name and its arguments, or None
+        """
+        name = self.PUSHES.get(type(var))
+        if name == 'pushInt' and not arrays.INT_MIN <= var <= arrays.INT_MAX:
+            name = 'pushLong'
+        return None if name is None else (name, [var])
+
+    def push_array(self, var):
+        """
+        Push a Python sequence as a remote array with a single call
+
+        Numeric sequences are sent as binary data, sequences of objects are
+        sent as entry points (see gadget.arrays).
+
         Keyword arguments:
-        dex -- the dex content to load
+        var -- a list, tuple, array.array or NumPy array
 
         Returns:
-        the new entry point for the loaded object (macro)
+        the new entry point for the array
         """
-        return self.get_field(
-                self.protocol.loadMacro(classname, b64encode(dex)),
-                [])
+        encoded = arrays.encode(var)
+        if encoded is None:
+            entry_points = self.to_arguments(list(var))
+            result = self._request('pushArray', 'java.lang.Object',
+                                   'entry_points', entry_points)
+            self.lifecycle.discard(entry_points)
+            return result
+        return self._request('pushArray', *encoded)
+
+    def to_arguments(self, args):
+        """
+        Convert Python arguments to remote call arguments
+
+        Python values are inlined in the call if the remote end point
+        supports it (see the inline attribute). Otherwise they are pushed
+        through a single pipeline, or queued if a batch is active. Pushed
+        values are not wrapped.
+
+        Keyword arguments:
+        args -- list of Python typed objects or mapped objects
+
+        Returns:
+        the list of call arguments
+        """
+        if self.inline:
+            return [self._inline(arg) for arg in args]
+        if self._batch is not None:
+            return [self.to_entry_point(arg) for arg in args]
+        calls = dict((index, self._push_call(arg))
+                     for index, arg in enumerate(args))
+        pushes = [index for index in calls if calls[index] is not None]
+        if len(pushes) < 2:
+            return [self.to_entry_point(arg) for arg in args]
+        arguments = list(args)
+        with self.pipeline() as pipeline:
+            for index in pushes:
+                arguments[index] = pipeline.call(*calls[index])
+        for index in pushes:
+            arguments[index] = arguments[index].result()
+            self.lifecycle.own(arguments[index])
+        return [arg if index in pushes else self.to_entry_point(arg)
+                for index, arg in enumerate(arguments)]
+
+    def _inline(self, var):
+        """
+        Convert a Python typed object to an inline call argument
+        """
+        call = self._push_call(var)
+        if call is None:
+            return self.to_entry_point(var)
+        type_ = 'long' if call[0] == 'pushLong' else self.INLINE[type(var)]
+        return {'type': type_, 'value': var}
 
     def to_object(self, var):
         """
@@ -333,14 +1913,10 @@ class Service(object):
         Returns:
         a mapped class instance for remote usage
         """
-        if type(var) is str:
-            return self.get_field(self.protocol.pushString(var), [])
-        elif type(var) is int:
-            return self.get_field(self.protocol.pushInt(var), [])
-        elif type(var) is bool:
-            return self.get_field(self.protocol.pushBool(var), [])
-        elif var is None:
+        entry_point = self.to_entry_point(var)
+        if entry_point is None:
             return None
+        return self.get_field(entry_point, [])
 
 
 class AppResources(object):
@@ -368,33 +1944,156 @@ class Application(object):
     implementation detail.
     """
 
-    def __init__(self, remote, app):
+    def __init__(self, remote, app, pool_size=1, codec=None, cache=None,
+                 freshness=ALWAYS, ttl=None, inline=False, metrics=False):
         """
         Connect to the remote application and initialize the local object
 
         Keyword arguments:
-        remote -- remote address and port
-        app    -- remote application name
+        remote    -- remote address and port
+        app       -- remote application name
+        pool_size -- count of connections to the remote application, more
+                     than one allows concurrent calls from several threads
+        codec     -- message codec name or instance (see gadget.codec)
+        cache     -- persist class metadata across sessions: True for the
+                     default location, or a database path, or a
+                     PersistentCache instance
+        freshness -- remote value freshness policy: 'always', 'ttl' or
+                     'manual' (see gadget.cache.ValueCache)
+        ttl       -- value lifetime in seconds, for the 'ttl' policy
+        inline    -- inline Python values in call arguments, if supported
+                     by the remote end point
+        metrics   -- record remote call metrics (see stats), calls are
+                     not recorded by default unless a hook is added (see
+                     add_stats_hook)
         """
         #assert app in list_applications(remote), \
         #    RuntimeError("Cannot find the application")
         self.app = app
-        self.protocol = Protocol(remote, app)
-        self.service = Service(self.protocol)
+        self.metrics = Metrics()
+        recorded = self.metrics if metrics else None
+        if pool_size > 1:
+            self.protocol = ProtocolPool(
+                remote, app, pool_size, codec, recorded)
+        else:
+            self.protocol = Protocol(remote, app, codec, recorded)
+        self.service = Service(self.protocol, freshness, ttl, inline)
         self.context = self.find('android.content.Context')[0]
+        if cache:
+            if not isinstance(cache, PersistentCache):
+                cache = PersistentCache(None if cache is True else cache)
+            self.service.metadata.attach(cache, self.get_cache_scope())
         self._R = AppResources(self, self.app)
 
-    def get_entry_points(self, force=True):
+    def get_entry_points(self, force=False):
         """
         List the application entry points
+
+        Keyword arguments:
+        force -- enumerate and refresh every entry point again
         """
         return self.service.get_entry_points(force=force)
 
+    def batch(self, window=None):
+        """
+        Open a batch of remote calls (see Service.batch)
+        """
+        return self.service.batch(window)
+
+    def invalidate(self, obj=None):
+        """
+        Drop cached remote values, so that they are fetched on next access
+
+        Keyword arguments:
+        obj -- drop only the values of this object and its fields
+               (default: all values)
+        """
+        if obj is None:
+            self.service.values.invalidate()
+        else:
+            self.service.values.invalidate(obj._entry_point, obj._path)
+
+    def snapshot(self):
+        """
+        Read remote values at most once within the returned context
+
+            with app.snapshot():
+                scores = [player.mScore for player in players]
+        """
+        return self.service.values.snapshot()
+
+    def set_freshness(self, policy, ttl=None):
+        """
+        Change the remote value freshness policy
+
+        Keyword arguments:
+        policy -- 'always', 'ttl' or 'manual'
+        ttl    -- value lifetime in seconds, for the 'ttl' policy
+        """
+        self.service.values.configure(policy, ttl)
+
+    def entry_point_stats(self):
+        """
+        Get client allocated entry point counters (see
+        gadget.lifecycle.EntryPointTracker.stats)
+        """
+        return self.service.lifecycle.stats()
+
+    def stats(self, reset=False):
+        """
+        Get remote call metrics: count of calls and failed calls, bytes
+        sent and received and latency percentiles, per remote method (see
+        gadget.stats.Metrics.summary)
+
+        Calls are only recorded if the application was created with the
+        metrics option or once a hook was added, otherwise every counter
+        stays empty.
+
+        Keyword arguments:
+        reset -- start recording from scratch once the metrics are read
+        """
+        return self.metrics.summary(reset)
+
+    def reset_stats(self):
+        """
+        Drop the remote call metrics recorded so far
+        """
+        self.metrics.reset()
+
+    def add_stats_hook(self, hook):
+        """
+        Call a function on every remote call, to export metrics (see
+        gadget.stats.Metrics.add_hook)
+
+        Hooks are called on recorded calls only, so that recording is
+        enabled from then on, even without the metrics option.
+        """
+        self.metrics.add_hook(hook)
+        self.protocol.metrics = self.metrics
+
+    def remove_stats_hook(self, hook):
+        """
+        Stop calling a function added by add_stats_hook
+        """
+        self.metrics.remove_hook(hook)
+
+    def get_cache_scope(self):
+        """
+        Identify the remote application for the persistent metadata cache
+
+        Returns:
+        a tuple of device fingerprint, package name and package version
+        """
+        build = self.get_class('android.os.Build')()
+        info = self.context.getPackageManager().getPackageInfo(self.app, 0)
+        return (str(build.FINGERPRINT), self.app,
+                '%s-%s' % (info.versionName, info.versionCode))
+
     def find(self, classname):
         """
         Find entry points with a given class name
         """
-        return filter(instanceof(classname), self.entry_points)
+        return self.service.find_entry_points(classname)
 
     def load(self, classname, apkfile):
         """
@@ -404,8 +2103,7 @@ class Application(object):
         classname   -- the classname to retrieve
         apkfile     -- the apk file to load inside the remote app
         """
-        content = open(apkfile,'rb').read()
-        return self.service.load_macro(classname, content)
+        return self.service.load_macro_file(classname, apkfile)
 
     def get_class(self, classname):
         """
@@ -416,6 +2114,30 @@ class Application(object):
         """
         return self.service.get_class(classname)
 
+    def resolve(self, expression, root=None):
+        """
+        Get an object given a dotted chain of field names
+
+        The whole chain is fetched with a single remote call once compiled
+        (see Service.resolve):
+
+            activities = app.resolve("context.mBase.mMainThread.mActivities")
+
+        Keyword arguments:
+        expression -- the dotted field chain, starting with an application
+                      attribute unless a root object is given
+        root       -- the root object of the chain
+
+        Returns:
+        a mapped class instance, or None if a field on the way is null
+        """
+        names = expression.split('.')
+        if root is None:
+            root = getattr(self, names.pop(0))
+        if not names:
+            return root
+        return self.service.resolve(root, names)
+
     def get_resources(self):
         """
         Access the remote application resources
@@ -434,7 +2156,9 @@ class Application(object):
         """
         List running activities
         """
-        return [activity_record.activity for activity_record in self.context.mBase.mMainThread.mActivities._M.values()]
+        activities = self.resolve('context.mBase.mMainThread.mActivities')
+        return [activity_record.activity
+                for activity_record in activities.values()]
 
 
     entry_points = property(get_entry_points)
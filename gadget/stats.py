@@ -0,0 +1,277 @@
+"""
+Remote call metrics
+
+Protocol instances may record every remote call they perform: the count
+of calls and failed calls, the count of bytes sent and received, and the
+latency of the calls, per remote method name.
+
+Latencies are kept in histograms with logarithmic buckets, so that the
+memory used does not depend on the count of calls, percentiles being
+estimated within a few percent. The latency of a pipelined call runs from
+the request being sent to the answer being received, so it includes the
+time spent waiting behind the other requests of the pipeline.
+
+Hooks may be registered to export every call to an external monitoring
+system. Hooks are called with the remote method name, the latency in
+seconds, the count of bytes sent and received, and whether the call failed.
+They run on the calling thread, while the connection is in use, so they
+should be quick. Exceptions raised by hooks are logged and ignored, so
+that a failing hook never disturbs the calls.
+
+Recording is disabled by not giving any Metrics instance to a protocol,
+which then only tests for it once per call.
+"""
+
+import math
+import bisect
+import logging
+import threading
+
+log = logging.getLogger(__name__)
+
+# histogram bucket bounds, in seconds: from 10 microseconds to about two
+# minutes, each bucket being 2^(1/8) (about 9%) wider than the previous one
+GROWTH = 2 ** 0.125
+BOUNDS = [1e-5 * GROWTH ** index for index in range(190)]
+
+# reported latency percentiles
+PERCENTILES = (50, 95, 99)
+
+
+class Histogram(object):
+    """
+    Latency histogram with logarithmic buckets
+    """
+
+    __slots__ = ('counts', 'count', 'total', 'minimum', 'maximum')
+
+    def __init__(self):
+        """
+        Initialize an empty histogram
+        """
+        # the last bucket holds every value above the last bound
+        self.counts = [0] * (len(BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.minimum = None
+        self.maximum = None
+
+    def add(self, value):
+        """
+        Record a value, in seconds
+        """
+        self.counts[bisect.bisect_left(BOUNDS, value)] += 1
+        self.count += 1
+        self.total += value
+        if self.minimum is None or value < self.minimum:
+            self.minimum = value
+        if self.maximum is None or value > self.maximum:
+            self.maximum = value
+
+    def merge(self, other):
+        """
+        Add the values recorded by another histogram
+        """
+        for index, count in enumerate(other.counts):
+            self.counts[index] += count
+        self.count += other.count
+        self.total += other.total
+        if other.minimum is not None:
+            self.minimum = other.minimum if self.minimum is None \
+                else min(self.minimum, other.minimum)
+            self.maximum = other.maximum if self.maximum is None \
+                else max(self.maximum, other.maximum)
+
+    def percentile(self, percent):
+        """
+        Estimate a percentile
+
+        The upper bound of the bucket holding the percentile is returned,
+        capped by the maximum recorded value.
+
+        Keyword arguments:
+        percent -- the percentile, between 0 and 100
+
+        Returns:
+        the estimated value in seconds, or None if the histogram is empty
+        """
+        if not self.count:
+            return None
+        rank = max(1, int(math.ceil(self.count * percent / 100.0)))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                if index == len(BOUNDS):
+                    return self.maximum
+                return min(BOUNDS[index], self.maximum)
+
+    def summary(self):
+        """
+        Summarize the histogram
+
+        Returns:
+        a dictionary with the mean, minimum, maximum and percentiles (p50,
+        p95, p99) in seconds
+        """
+        summary = {
+            'mean': self.total / self.count if self.count else None,
+            'min': self.minimum,
+            'max': self.maximum,
+        }
+        for percent in PERCENTILES:
+            summary['p%d' % percent] = self.percentile(percent)
+        return summary
+
+
+class MethodMetrics(object):
+    """
+    Counters of a single remote method
+    """
+
+    __slots__ = ('calls', 'errors', 'sent', 'received', 'latency')
+
+    def __init__(self):
+        """
+        Initialize zeroed counters
+        """
+        self.calls = 0
+        self.errors = 0
+        self.sent = 0
+        self.received = 0
+        self.latency = Histogram()
+
+    def merge(self, other):
+        """
+        Add the counters of another method
+        """
+        self.calls += other.calls
+        self.errors += other.errors
+        self.sent += other.sent
+        self.received += other.received
+        self.latency.merge(other.latency)
+
+    def summary(self):
+        """
+        Summarize the counters
+
+        Returns:
+        a dictionary with the count of calls and failed calls, the bytes
+        sent and received and the latency summary (see Histogram.summary)
+        """
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'bytes_out': self.sent,
+            'bytes_in': self.received,
+            'latency': self.latency.summary(),
+        }
+
+
+class Metrics(object):
+    """
+    Remote call metrics, shared by every connection of an application
+    """
+
+    def __init__(self):
+        """
+        Initialize empty metrics
+        """
+        self._lock = threading.Lock()
+        self._methods = {}
+        self._hooks = []
+
+    def record(self, name, latency, sent, received, failed=False):
+        """
+        Record a remote call
+
+        Keyword arguments:
+        name     -- name of the remote method
+        latency  -- time from request to answer, in seconds
+        sent     -- size of the request payload, in bytes
+        received -- size of the answer payload, in bytes
+        failed   -- whether the remote method failed
+        """
+        with self._lock:
+            method = self._methods.get(name)
+            if method is None:
+                method = self._methods[name] = MethodMetrics()
+            method.calls += 1
+            method.errors += failed
+            method.sent += sent
+            method.received += received
+            method.latency.add(latency)
+        for hook in self._hooks:
+            try:
+                hook(name, latency, sent, received, failed)
+            except Exception:
+                log.exception("Metrics hook %r failed", hook)
+
+    def add_hook(self, hook):
+        """
+        Call a function on every recorded call
+
+        Keyword arguments:
+        hook -- function taking the method name, latency, bytes sent,
+                bytes received and failure flag
+        """
+        with self._lock:
+            # copied so that recording iterates without the lock
+            self._hooks = self._hooks + [hook]
+
+    def remove_hook(self, hook):
+        """
+        Stop calling a hook function
+
+        Exceptions:
+        ValueError -- the hook was not added
+        """
+        with self._lock:
+            hooks = list(self._hooks)
+            hooks.remove(hook)
+            self._hooks = hooks
+
+    def reset(self):
+        """
+        Drop every recorded call, hooks are kept
+        """
+        with self._lock:
+            self._methods = {}
+
+    def summary(self, reset=False):
+        """
+        Summarize the recorded calls
+
+        Keyword arguments:
+        reset -- drop the recorded calls once summarized
+
+        Returns:
+        a dictionary with a 'methods' dictionary holding the summary of
+        every remote method by name (see MethodMetrics.summary), and a
+        'total' summary of every call
+        """
+        with self._lock:
+            methods = self._methods
+            if reset:
+                self._methods = {}
+            else:
+                # counters are updated in place
+                methods = dict((name, self._copy(method))
+                               for name, method in methods.items())
+        total = MethodMetrics()
+        for method in methods.values():
+            total.merge(method)
+        return {
+            'methods': dict((name, method.summary())
+                            for name, method in methods.items()),
+            'total': total.summary(),
+        }
+
+    @staticmethod
+    def _copy(method):
+        """
+        Copy the counters of a method
+        """
+        copy = MethodMetrics()
+        copy.merge(method)
+        return copy
@@ -0,0 +1,135 @@
+"""
+Framed transport
+
+Gadget messages are framed with a 4 bytes big endian length header (see
+gadget.proto). The transport sends and receives such frames over a
+connected stream socket while avoiding needless copies:
+
+* the header and the payload are handed to the kernel in a single call
+  for small frames, large payloads are sent as is right after the header
+* incoming data is read into a preallocated buffer with recv_into, and
+  several frames may be parsed out of a single read
+* payloads larger than the buffer are received directly into their own
+  preallocated buffer
+"""
+
+import socket
+import struct
+
+# frame header: payload length as a big endian unsigned int
+HEADER = struct.Struct('>I')
+
+# payloads up to this size are sent along with their header
+SMALL_FRAME = 64 * 1024
+
+
+class Transport(object):
+    """
+    Framed transport over a connected stream socket
+    """
+
+    def __init__(self, sock, buffer_size=256 * 1024):
+        """
+        Initialize the transport
+
+        Keyword arguments:
+        sock        -- a connected stream socket
+        buffer_size -- size of the receive buffer
+        """
+        self._socket = sock
+        try:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        except (socket.error, AttributeError):
+            # not a tcp socket
+            pass
+        self._buffer = bytearray(buffer_size)
+        self._view = memoryview(self._buffer)
+        # buffered data lies between both offsets
+        self._start = 0
+        self._end = 0
+
+    def close(self):
+        """
+        Close the underlying socket
+        """
+        self._socket.close()
+
+    def send(self, payload):
+        """
+        Send a single frame
+
+        Keyword arguments:
+        payload -- the frame payload
+        """
+        header = HEADER.pack(len(payload))
+        if len(payload) <= SMALL_FRAME:
+            self._socket.sendall(header + payload)
+        else:
+            self._socket.sendall(header)
+            self._socket.sendall(payload)
+
+    def send_parts(self, length, parts):
+        """
+        Send a single frame whose payload is produced in parts
+
+        Keyword arguments:
+        length -- the total payload length
+        parts  -- iterable of payload parts
+        """
+        self._socket.sendall(HEADER.pack(length))
+        for part in parts:
+            self._socket.sendall(part)
+
+    def _recv(self, view):
+        """
+        Read available data into the given memory view
+
+        Exceptions:
+        IOError -- the connection was closed
+        """
+        count = self._socket.recv_into(view)
+        if count == 0:
+            raise IOError("Connection closed while receiving")
+        return count
+
+    def _fill(self, count):
+        """
+        Make sure at least count bytes are buffered
+
+        The buffer is compacted if the requested data would not fit after
+        the buffered data.
+        """
+        if self._start + count > len(self._buffer):
+            size = self._end - self._start
+            self._view[:size] = self._view[self._start:self._end]
+            self._start, self._end = 0, size
+        while self._end - self._start < count:
+            self._end += self._recv(self._view[self._end:])
+
+    def receive(self):
+        """
+        Receive a single frame
+
+        Returns:
+        the frame payload
+        """
+        self._fill(HEADER.size)
+        length, = HEADER.unpack_from(self._buffer, self._start)
+        self._start += HEADER.size
+        if length <= len(self._buffer):
+            self._fill(length)
+            payload = self._view[self._start:self._start + length].tobytes()
+            self._start += length
+        else:
+            # large frames get their own buffer, filled without copy
+            payload = bytearray(length)
+            view = memoryview(payload)
+            offset = self._end - self._start
+            view[:offset] = self._view[self._start:self._end]
+            self._start = self._end = 0
+            while offset < length:
+                offset += self._recv(view[offset:])
+            payload = bytes(payload)
+        if self._start == self._end:
+            self._start = self._end = 0
+        return payload
@@ -8,6 +8,7 @@ deployment and usage.
 """
 
 from gadget.mapping import maptype, Object
+from gadget.futures import resolved
 
 
 @maptype('java.lang.Class')
@@ -16,6 +17,8 @@ class Class(Object):
     Remote class object
     """
 
+    __slots__ = ()
+
     def __call__(self, *args):
         """
         Create a new instance of this class
@@ -23,15 +26,14 @@ class Class(Object):
         Arguments passed to this method are automatically forwarded to the
         constructor.
         """
-        # list of actual sent arguments
-        objects = [arg if isinstance(arg, Object)
-            else self._service.to_object(arg)
-            for arg in args]
-        arguments = [arg._getentrypoint() for arg in objects]
-        return self._service.new_instance(
-            self._entry_point,
-            self._path,
-            arguments)
+        # pushed arguments must live until the instance is created
+        with self._service.holding():
+            # list of actual sent arguments
+            arguments = self._service.to_arguments(args)
+            return self._service.new_instance(
+                self._entry_point,
+                self._path,
+                arguments)
 
 
 @maptype('null')
@@ -39,6 +41,9 @@ class Null(Object):
     """
     Remote null
     """
+
+    __slots__ = ()
+
     def __init__(self, service=None, types=None, entry_point=-1, path=[]):
         Object.__init__(self, service, types, -1 ,[])
 
@@ -61,6 +66,8 @@ class Integer(Object):
     Remote integer object
     """
 
+    __slots__ = ('_value',)
+
     def __repr__(self):
         """
         Pretty print
@@ -88,7 +95,8 @@ class Integer(Object):
         """
         Grab the Integer value
         """
-        self._value = int(self._service.get_value(self._entry_point, self._path))
+        self._value = int(resolved(
+            self._service.get_value(self._entry_point, self._path)))
 
 
 @maptype('java.lang.Boolean')
@@ -97,6 +105,8 @@ class Boolean(Object):
     Remote bool object
     """
 
+    __slots__ = ('_value',)
+
     def __repr__(self):
         """
         Pretty print
@@ -107,7 +117,8 @@ class Boolean(Object):
         """
         Grab the boolean value
         """
-        self._value = (self._service.get_value(self._entry_point, self._path)=='true')
+        self._value = (resolved(
+            self._service.get_value(self._entry_point, self._path)) == 'true')
 
     def __nonzero__(self):
         return self._value
@@ -119,6 +130,8 @@ class String(Object):
     Remote string object
     """
 
+    __slots__ = ('_value',)
+
     def __str__(self):
         """
         String representation
@@ -146,31 +159,50 @@ class String(Object):
         """
         Grab the string value
         """
-        self._value = self._service.get_value(self._entry_point, self._path)
+        self._value = resolved(
+            self._service.get_value(self._entry_point, self._path))
 
 
-@maptype('java.util.AbstractMap')
+@maptype('java.util.AbstractMap', 'java.util.Map')
 class Map(Object):
     """
     Remote map object
 
     Provides convenient Python-like dictionary access.
+
+    Keys, values and items are read from toArray copies of the key set and
+    of the values, fetched in chunks through pipelines (see Collection).
+    Both copies are taken one after the other, concurrent modifications of
+    the remote map may therefore lead to inconsistent entries.
     """
 
+    __slots__ = ()
+
+    # count of entries fetched at once
+    CHUNK = 256
+
     def __len__(self):
         """
         Return the size of the map
         """
-        return int(self.size._value)
+        return int(self._M.size()._value)
+
+    def __contains__(self, key):
+        """
+        Check whether the remote map contains a key
+        """
+        return bool(self._M.containsKey(key))
 
     def __getitem__(self, key):
         """
         Get a remote item contained in the map
+
+        Keys mapped to null are reported as missing.
         """
-        if self.containsKey(key):
-            return self.get(key)
-        else:
+        value = self.get(key)
+        if value is None:
             raise IndexError()
+        return value
 
     def __setitem__(self, key, value):
         """
@@ -178,6 +210,100 @@ class Map(Object):
         """
         self.put(key, value)
 
+    def __iter__(self):
+        return self.iterkeys()
+
+    def get(self, key, default=None):
+        """
+        Get a remote item with a single remote call
+
+        Keyword arguments:
+        key     -- the item key
+        default -- returned if the key is missing or mapped to null
+        """
+        value = self._M.get(key)
+        return default if value is None else value
+
+    def iteritems(self, chunk=None):
+        """
+        Iterate over the map entries
+
+        Keyword arguments:
+        chunk -- count of entries fetched at once (default: CHUNK)
+        """
+        chunk = chunk or self.CHUNK
+        length = len(self)
+        keys = self._M.keySet()._M.toArray()
+        values = self._M.values()._M.toArray()
+        for start in range(0, length, chunk):
+            indices = range(start, min(start + chunk, length))
+            for item in zip(
+                    self._service.get_elements(
+                        keys._entry_point, keys._path, indices),
+                    self._service.get_elements(
+                        values._entry_point, values._path, indices)):
+                yield item
+
+    def iterkeys(self, chunk=None):
+        """
+        Iterate over the map keys
+        """
+        chunk = chunk or self.CHUNK
+        length = len(self)
+        keys = self._M.keySet()._M.toArray()
+        for start in range(0, length, chunk):
+            for key in self._service.get_elements(
+                    keys._entry_point, keys._path,
+                    range(start, min(start + chunk, length))):
+                yield key
+
+    def itervalues(self, chunk=None):
+        """
+        Iterate over the map values
+        """
+        chunk = chunk or self.CHUNK
+        length = len(self)
+        values = self._M.values()._M.toArray()
+        for start in range(0, length, chunk):
+            for value in self._service.get_elements(
+                    values._entry_point, values._path,
+                    range(start, min(start + chunk, length))):
+                yield value
+
+    def keys(self):
+        return list(self.iterkeys())
+
+    def values(self):
+        return list(self.itervalues())
+
+    def items(self):
+        return list(self.iteritems())
+
+    def to_dict(self):
+        """
+        Copy the remote map into a dictionary
+
+        Integer, Boolean and String keys and values are converted to their
+        Python values, other objects are kept as mapped objects.
+        """
+        return dict((pythonize(key), pythonize(value))
+                    for key, value in self.iteritems())
+
+    def update(self, other):
+        """
+        Put several items inside the remote map
+
+        Keyword arguments:
+        other -- a remote map, put with a single putAll call, or a
+                 dictionary, put through a batch of remote calls
+        """
+        if isinstance(other, Object):
+            self._M.putAll(other)
+            return
+        with self._service.batch():
+            for key, value in other.items():
+                self._M.put(key, value)
+
 
 @maptype('java.util.Collection')
 class Collection(Object):
@@ -185,13 +311,25 @@ class Collection(Object):
     Remote collection object
 
     Provides convenient Python-like list access and enumeration.
+
+    Iteration and slicing work on a remote array copy of the collection,
+    whose elements are fetched in chunks through pipelines. Concurrent
+    modifications of the remote collection are therefore not reflected
+    while iterating. Elements of lists are indexed with List.get, other
+    collections are copied.
     """
 
+    __slots__ = ()
+
+    # count of elements fetched at once
+    CHUNK = 256
+
     class Iterator:
         """
         Collection iterator
 
-        Required to provide a for..in support
+        Element by element iteration through the remote iterator, two
+        remote calls per element.
         """
         def __init__(self, obj):
             self._obj = obj
@@ -206,14 +344,122 @@ class Collection(Object):
             else:
                 raise StopIteration()
 
+    class BulkIterator:
+        """
+        Chunked collection iterator
+
+        Required to provide a for..in support
+        """
+        def __init__(self, obj, chunk):
+            self._obj = obj
+            self._chunk = chunk
+            self._array, self._length = obj._toarray()
+            self._index = 0
+            self._buffer = []
+
+        def __iter__(self):
+            return self
+
+        def __length_hint__(self):
+            return self._length - self._index + len(self._buffer)
+
+        def next(self):
+            if not self._buffer:
+                if self._index >= self._length:
+                    raise StopIteration()
+                stop = min(self._index + self._chunk, self._length)
+                self._buffer = self._obj._elements(
+                    self._array, range(self._index, stop))
+                self._buffer.reverse()
+                self._index = stop
+            return self._buffer.pop()
+
     def __repr__(self):
-        return '<Collection object size=%d>' % self._M.size()._value
+        return '<Collection object size=%d>' % len(self)
+
+    def __len__(self):
+        """
+        Return the size of the collection
+        """
+        return int(self._M.size()._value)
 
     def __in__(self, obj):
         return self.contains(obj)
 
     def __iter__(self):
-        return self.Iterator(self)
+        return self.BulkIterator(self, self.CHUNK)
+
+    def __getitem__(self, index):
+        """
+        Get an element, or a list of elements for a slice
+        """
+        if isinstance(index, slice):
+            array, length = self._toarray()
+            return self._elements(array, range(*index.indices(length)))
+        if 'java.util.List' in self._types:
+            return self._get(index)
+        array, length = self._toarray()
+        if index < 0:
+            index += length
+        if not 0 <= index < length:
+            raise IndexError("Collection index out of range")
+        return self._elements(array, [index])[0]
+
+    def iterate(self, chunk=None):
+        """
+        Iterate over the collection
+
+        Keyword arguments:
+        chunk -- count of elements fetched at once (default: CHUNK)
+        """
+        return self.BulkIterator(self, chunk or self.CHUNK)
+
+    def _get(self, index):
+        """
+        Get a list element without copying the list
+        """
+        if index < 0:
+            index += len(self)
+        if index >= 0:
+            try:
+                return self._M.get(index)
+            except RuntimeError:
+                # an error other than the index being out of range
+                if index < len(self):
+                    raise
+        raise IndexError("Collection index out of range")
+
+    def _toarray(self):
+        """
+        Copy the collection to a remote array
+
+        The collection is first copied to a private list, so that the
+        length matches the array even if the collection is modified
+        meanwhile.
+
+        Returns:
+        a tuple of the array object and its length
+        """
+        copy = self._service.get_class('java.util.ArrayList')(self)
+        return copy._M.toArray(), len(copy)
+
+    def _elements(self, array, indices):
+        """
+        Fetch elements of a remote array copy
+        """
+        return self._service.get_elements(
+            array._entry_point, array._path, indices)
+
+
+def pythonize(obj):
+    """
+    Convert a value holding mapped object to its Python value
+
+    Other objects are returned as is.
+    """
+    if isinstance(obj, (Integer, Boolean, String)):
+        return obj._value
+    return obj
 
 
 @maptype('android.app.Activity')
@@ -222,6 +468,8 @@ class Activity(Object):
     Remote Android activity
     """
 
+    __slots__ = ()
+
     def refresh(self):
         """
         Activity refresh
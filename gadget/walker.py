@@ -0,0 +1,176 @@
+"""
+Object graph walker
+
+Walks the remote object graph from a root object, following fields, and
+yields every object met along with the chain of field names leading to it.
+Objects are expanded by groups: the fields of every object of a group are
+listed, typed, pushed and marked as visited through a few pipelines, so
+that the count of round trips depends on the depth of the walk rather
+than on the count of objects.
+
+Visited objects are recorded in a remote java.util.IdentityHashMap, so
+that objects are identified by their remote identity.
+
+Example::
+
+    from gadget.walker import walk
+    from gadget.types import pythonize
+
+    for names, obj in walk(app.context, depth=4,
+                           classes=['java.lang.Integer']):
+        if pythonize(obj) == 42:
+            print '.'.join(names)
+"""
+
+from collections import deque
+
+from proto import VALUE_TYPES, PRIMITIVES
+
+# walk orders
+BFS, DFS = 'bfs', 'dfs'
+
+# objects that are yielded but never expanded
+LEAVES = frozenset(VALUE_TYPES) | frozenset(PRIMITIVES.values()) | \
+    frozenset(['java.lang.Class'])
+
+
+class Walker(object):
+    """
+    Object graph walker
+
+    Breadth first walks expand a whole level at once, depth first walks
+    expand one object at a time.
+    """
+
+    def __init__(self, service, depth=3, classes=None, order=BFS):
+        """
+        Initialize the walker
+
+        Keyword arguments:
+        service -- the inspection service
+        depth   -- maximum count of fields followed from the root
+        classes -- only yield instances of these class names (default: all
+                   objects)
+        order   -- BFS or DFS
+        """
+        if order not in (BFS, DFS):
+            raise ValueError("Unknown walk order %s" % order)
+        self._service = service
+        self._depth = depth
+        self._classes = classes
+        self._order = order
+        self._visited = None
+
+    def _matches(self, obj):
+        """
+        Check whether an object must be yielded
+        """
+        return self._classes is None or any(
+            classname in obj._types for classname in self._classes)
+
+    def _visit(self, objects):
+        """
+        Mark objects as visited
+
+        Returns:
+        the list of objects that were not visited before
+        """
+        protocol = self._service.protocol
+        lifecycle = self._service.lifecycle
+        self._service.push_objects(objects)
+        # the map returns the previous value, null for new objects
+        previous = protocol.map('invokeMethodByName', [
+            (self._visited._entry_point, [], 'put',
+             [obj._entry_point, obj._entry_point]) for obj in objects])
+        for entry_point in previous:
+            lifecycle.own(entry_point)
+        lifecycle.discard(previous)
+        return [obj for obj, entry_point in zip(objects, previous)
+                if entry_point < 0]
+
+    def _expand(self, nodes):
+        """
+        Get the children of several objects at once
+
+        Keyword arguments:
+        nodes -- list of (names, object) tuples
+
+        Returns:
+        the list of (names, object) tuples for new children
+        """
+        tables = self._service.get_field_tables([obj for _, obj in nodes])
+        names, addresses = [], []
+        for (path, obj), table in zip(nodes, tables):
+            for name, (_, _, index) in sorted(table.items()):
+                names.append(path + (name,))
+                addresses.append((obj._entry_point, obj._path + [index]))
+        children = [(path, obj) for path, obj in zip(
+            names, self._service.get_objects(addresses)) if obj is not None]
+        objects = [obj for _, obj in children if obj._types[0] not in LEAVES]
+        new = set(id(obj) for obj in self._visit(objects)) if objects \
+            else set()
+        return [(path, obj) for path, obj in children
+                if obj._types[0] in LEAVES or id(obj) in new]
+
+    def walk(self, root):
+        """
+        Walk the object graph
+
+        Keyword arguments:
+        root -- the root object, or an entry point
+
+        Returns:
+        a generator of (names, object) tuples, names being the tuple of
+        field names leading from the root to the object
+        """
+        if not hasattr(root, '_types'):
+            root = self._service.get_field(root, [])
+        self._visited = self._service.get_class(
+            'java.util.IdentityHashMap')()
+        self._visit([root])
+        if self._matches(root):
+            yield (), root
+        if self._order == BFS:
+            frontier = [((), root)]
+            for _ in range(self._depth):
+                if not frontier:
+                    break
+                children = self._expand(frontier)
+                for path, obj in children:
+                    if self._matches(obj):
+                        yield path, obj
+                frontier = [(path, obj) for path, obj in children
+                            if obj._types[0] not in LEAVES]
+        else:
+            stack = deque([((), root)])
+            while stack:
+                path, obj = stack.pop()
+                if path and self._matches(obj):
+                    yield path, obj
+                if len(path) < self._depth and obj._types[0] not in LEAVES:
+                    stack.extend(reversed(self._expand([(path, obj)])))
+        self._visited = None
+
+
+def walk(root, depth=3, classes=None, order=BFS, service=None):
+    """
+    Walk the object graph from a root object (see Walker)
+
+    Keyword arguments:
+    root    -- the root mapped object, or an entry point
+    depth   -- maximum count of fields followed from the root
+    classes -- only yield instances of these class names
+    order   -- BFS or DFS
+    service -- the inspection service or application, required if the
+               root is an entry point
+
+    Exceptions:
+    ValueError -- the root is an entry point and no service is given
+    """
+    if service is None:
+        if not hasattr(root, '_service'):
+            raise ValueError("Walking from an entry point requires a service")
+        service = root._service
+    # applications hold their inspection service
+    service = getattr(service, 'service', service)
+    return Walker(service, depth, classes, order).walk(root)
@@ -2,6 +2,7 @@ import java.lang.reflect.Field;
 import java.util.Map.Entry;
 import java.util.ArrayList;
 import java.util.HashMap;
+import java.util.IdentityHashMap;
 import java.util.Iterator;
 
 /**
@@ -28,6 +29,11 @@ class Replay {
      */
     private HashMap<Field, Replay> mChildren;
 
+    /**
+     * Result field identifiers, by field identity.
+     */
+    private IdentityHashMap<Field, Integer> mFieldIds;
+
     /**
      * Constructor
      *
@@ -38,6 +44,7 @@ class Replay {
     public Replay(Object haystack, Object needle, int depth) {
 	mResults = new ArrayList<Field>();
 	mChildren = new HashMap<Field, Replay>();
+	mFieldIds = new IdentityHashMap<Field, Integer>();
 	mHaystack = haystack;
 	// Stop confition
 	if(depth > 0) {
@@ -106,6 +113,32 @@ class Replay {
 	return result;
     }
 
+    /**
+     * Identify the fields of a result chain.
+     *
+     * Result fields are kept by the macro, so that a field keeps the same
+     * identifier for the whole macro lifetime. Unlike hash codes,
+     * identifiers are unique.
+     *
+     * @param chain a result chain, as an array
+     * @return the comma separated field identifiers
+     */
+    public String getFieldIds(Object[] chain) {
+	StringBuilder ids = new StringBuilder();
+	for (Object field : chain) {
+	    Integer id = mFieldIds.get(field);
+	    if (id == null) {
+		id = mFieldIds.size();
+		mFieldIds.put((Field) field, id);
+	    }
+	    if (ids.length() > 0) {
+		ids.append(',');
+	    }
+	    ids.append(id);
+	}
+	return ids.toString();
+    }
+
     /**
      * Set all the items to the given value.
      *
@@ -19,11 +19,29 @@ Example::
     rep.update(100)
     # Set the score!
     rep.set(999999)
+
+The LocalReplay class provides the same features without loading any
+macro: numeric fields reachable from the haystack are read once in bulk
+(see gadget.walker), then filters are applied locally with NumPy, only
+reading surviving candidates again::
+
+    from macros.replay import LocalReplay
+
+    rep = LocalReplay.new(app, 0)
+    rep.update(20)
+    rep.increased()
+    rep.set(999999)
 """
 
 import os
 
 from gadget.mapping import maptype, Object
+from gadget.walker import walk
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
 CLASS_NAME = "Replay"
@@ -52,11 +70,70 @@ class Replay(Object):
     def _refresh(self):
         """
         Store the flat list of results.
+
+        Field chains are identified by the identifiers the macro gives to
+        their remote Field objects, which are unique and stable for the
+        macro lifetime. Chains met before keep their names, and names are
+        only resolved for fields never met before, then cached along with
+        the macro. Every step is performed for all the chains at once,
+        through pipelines.
         """
+        previous = dict((key, name) for name, key
+                        in getattr(self, '_results', {}).items())
+        if not hasattr(self, '_field_names'):
+            self._field_names = dict()
+        array, count = self.getResults()._toarray()
+        chains = self._invoke([(array._entry_point, array._path + [index])
+                               for index in range(count)], 'toArray')
+        keys = [tuple(int(ident) for ident in ids.split(',') if ident)
+                for ids in self._values(self._invoke(
+                    [(self._entry_point, self._path)] * count,
+                    'getFieldIds', [[chain] for chain in chains]))]
+        unknown = dict((ident, (chain, [index]))
+                       for chain, key in zip(chains, keys)
+                       for index, ident in enumerate(key)
+                       if ident not in self._field_names)
+        names = self._values(self._invoke(unknown.values(), 'getName'))
+        self._field_names.update(
+            zip(unknown.keys(), [str(name) for name in names]))
+        self._service.lifecycle.discard(chains)
         self._results = dict()
-        for result in self.getResults():
-            names = [str(field.getName()) for field in result]
-            self._results[".".join(names)] = result
+        for key in keys:
+            name = previous.get(key)
+            if name is None:
+                name = ".".join(self._field_names[ident] for ident in key)
+            self._results[name] = key
+
+    def _invoke(self, addresses, method, arguments=None):
+        """
+        Call a method on several objects at once
+
+        Keyword arguments:
+        addresses -- list of (entry point, path) tuples
+        method    -- method name
+        arguments -- list of argument entry point lists, one per call
+                     (default: no arguments)
+
+        Returns:
+        the list of entry points of the results
+        """
+        if arguments is None:
+            arguments = [[]] * len(addresses)
+        entry_points = self._service.protocol.map('invokeMethodByName', [
+            (entry_point, path, method, args)
+            for (entry_point, path), args in zip(addresses, arguments)])
+        for entry_point in entry_points:
+            self._service.lifecycle.own(entry_point)
+        return entry_points
+
+    def _values(self, entry_points):
+        """
+        Read the values of several entry points at once, then drop them
+        """
+        values = self._service.protocol.map(
+            'getValue', [(entry_point, []) for entry_point in entry_points])
+        self._service.lifecycle.discard(entry_points)
+        return values
 
     def __repr__(self):
         """
@@ -64,3 +141,235 @@ class Replay(Object):
         """
         return "<Replay with %d entities|%s>" % (
             len(self._results), ", ".join(self._results.keys()))
+
+
+# remote types of numeric fields
+NUMERIC_TYPES = ('java.lang.Integer', 'java.lang.Long', 'java.lang.Short',
+                 'java.lang.Byte', 'java.lang.Float', 'java.lang.Double')
+
+# remote types of floating point fields, others are integral
+FLOAT_TYPES = ('java.lang.Float', 'java.lang.Double')
+
+# value ranges of integral fields
+RANGES = {
+    'java.lang.Byte': (-2 ** 7, 2 ** 7 - 1),
+    'java.lang.Short': (-2 ** 15, 2 ** 15 - 1),
+    'java.lang.Integer': (-2 ** 31, 2 ** 31 - 1),
+    'java.lang.Long': (-2 ** 63, 2 ** 63 - 1),
+}
+
+# largest finite Float value
+FLOAT_MAX = 3.4028234663852886e+38
+
+# Python types pushed as boxed values of a remote type, other remote types
+# are built from the value string
+PUSHED_TYPES = {
+    'java.lang.Integer': int,
+    'java.lang.Long': long,
+    'java.lang.Double': float,
+}
+
+
+class LocalReplay(object):
+    """
+    Client side implementation, based on NumPy.
+
+    Candidate values are kept in NumPy arrays along with candidate ids,
+    every filter reads the values of the remaining candidates through
+    pipelines and narrows them down with vectorized comparisons. Integral
+    values are kept as int64 and floating point values as float64, so
+    that longs are compared exactly.
+    """
+
+    @classmethod
+    def new(cls, app, needle=None, haystack=None, depth=3):
+        """
+        Snapshot numeric fields, and keep those equal to the needle
+        """
+        if not haystack:
+            haystack = app.listActivities()[0]
+        replay = cls(haystack, depth)
+        if needle is not None:
+            replay._keep(replay._compare(
+                lambda current, previous: current == needle,
+                replay._values, replay._values))
+        return replay
+
+    def __init__(self, haystack, depth=3):
+        """
+        Snapshot every numeric field reachable from the haystack
+
+        Keyword arguments:
+        haystack -- the search root
+        depth    -- maximum count of fields followed from the root
+        """
+        if numpy is None:
+            raise ImportError("LocalReplay requires NumPy")
+        self._service = haystack._service
+        self._names = []
+        # wrappers keep their entry points alive
+        self._objects = []
+        for names, obj in walk(haystack, depth, classes=NUMERIC_TYPES):
+            self._names.append(".".join(names))
+            self._objects.append(obj)
+        self._floating = numpy.array(
+            [obj._types[0] in FLOAT_TYPES for obj in self._objects],
+            dtype=bool)
+        self._ids = numpy.arange(len(self._objects))
+        self._values = self._read(self._ids)
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __repr__(self):
+        """
+        Pretty print.
+        """
+        return "<LocalReplay with %d entities|%s>" % (
+            len(self), ", ".join(self.results()))
+
+    def _read(self, ids):
+        """
+        Read the current values of some candidates
+
+        Returns:
+        a tuple of an int64 array holding the integral values and a float64
+        array holding the floating point values, both indexed as the ids
+        """
+        values = self._service.protocol.map('getValue', [
+            (self._objects[index]._entry_point, self._objects[index]._path)
+            for index in ids])
+        floating = self._floating[ids]
+        integers = numpy.array(
+            [0 if isfloat else int(value)
+             for value, isfloat in zip(values, floating)], dtype=numpy.int64)
+        floats = numpy.array(
+            [float(value) if isfloat else 0.0
+             for value, isfloat in zip(values, floating)],
+            dtype=numpy.float64)
+        return integers, floats
+
+    def _compare(self, compare, current, previous):
+        """
+        Compare current and previous values of the remaining candidates,
+        each with the array of its kind
+
+        Returns:
+        a boolean mask
+        """
+        return numpy.where(self._floating[self._ids],
+                           compare(current[1], previous[1]),
+                           compare(current[0], previous[0]))
+
+    def _keep(self, mask, values=None):
+        """
+        Keep the candidates selected by a mask
+        """
+        values = self._values if values is None else values
+        self._ids = self._ids[mask]
+        self._values = (values[0][mask], values[1][mask])
+
+    def _filter(self, compare):
+        """
+        Read the candidates again and keep those matching a comparison
+        between current and previous values
+        """
+        values = self._read(self._ids)
+        self._keep(self._compare(compare, values, self._values), values)
+
+    def update(self, value):
+        """
+        Keep the fields currently equal to the value
+        """
+        self._filter(lambda current, previous: current == value)
+
+    def changed(self):
+        """
+        Keep the fields whose value changed since the last filter
+        """
+        self._filter(lambda current, previous: current != previous)
+
+    def unchanged(self):
+        """
+        Keep the fields whose value did not change since the last filter
+        """
+        self._filter(lambda current, previous: current == previous)
+
+    def increased(self):
+        """
+        Keep the fields whose value increased since the last filter
+        """
+        self._filter(lambda current, previous: current > previous)
+
+    def decreased(self):
+        """
+        Keep the fields whose value decreased since the last filter
+        """
+        self._filter(lambda current, previous: current < previous)
+
+    def results(self):
+        """
+        List the dotted field names of the remaining candidates
+        """
+        return [self._names[index] for index in self._ids]
+
+    def set(self, value):
+        """
+        Set all the remaining fields to the given value
+
+        The value is boxed once for every type of field, since fields only
+        accept their own type. Nothing is written unless the value fits
+        every type.
+
+        Exceptions:
+        ValueError -- the value does not fit the type of some field
+        """
+        addresses = {}
+        for index in self._ids:
+            obj = self._objects[index]
+            addresses.setdefault(obj._types[0], []).append(
+                (obj._entry_point, obj._path))
+        values = dict((classname, self._convert(classname, value))
+                      for classname in addresses)
+        # wrappers keep the boxed values alive until written
+        boxed = dict((classname, self._box(classname, values[classname]))
+                     for classname in addresses)
+        for address in sum(addresses.values(), []):
+            self._service.values.invalidate(*address)
+        self._service.protocol.map('setValue', [
+            (entry_point, path, boxed[classname]._entry_point)
+            for classname, addresses_ in addresses.items()
+            for entry_point, path in addresses_])
+
+    @staticmethod
+    def _convert(classname, value):
+        """
+        Convert a value to the Python type matching a remote numeric type
+
+        Exceptions:
+        ValueError -- the value is out of the range of the type
+        """
+        if classname in FLOAT_TYPES:
+            converted = float(value)
+            fits = classname != 'java.lang.Float' or \
+                not FLOAT_MAX < abs(converted) < float('inf')
+        else:
+            converted = int(value)
+            low, high = RANGES[classname]
+            fits = converted == value and low <= converted <= high
+        if not fits:
+            raise ValueError("%r does not fit %s fields" % (value, classname))
+        return converted
+
+    def _box(self, classname, value):
+        """
+        Push a value boxed to a remote numeric type
+
+        Returns:
+        a mapped class instance
+        """
+        pushed = PUSHED_TYPES.get(classname)
+        if pushed is not None:
+            return self._service.to_object(pushed(value))
+        # Byte, Short and Float have no push call
+        return self._service.get_class(classname)(repr(value))